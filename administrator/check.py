@@ -4,7 +4,7 @@ from discord import Permissions
 from discord.ext import commands
 from discord.ext.commands import NoPrivateMessage, NotOwner, MissingPermissions
 
-import db
+from administrator.utils import event_is_enabled
 
 
 class ExtensionDisabled(commands.CheckFailure):
@@ -17,10 +17,7 @@ def is_enabled():
         async def wrapped(*args):
             ctx = args[1]
             if ctx.guild:
-                s = db.Session()
-                es = s.query(db.ExtensionState).get((args[0].qualified_name, ctx.guild.id))
-                s.close()
-                if es and not es.state:
+                if not event_is_enabled(args[0].qualified_name, ctx.guild.id):
                     return
                     # raise ExtensionDisabled()
                 return await func(*args)
@@ -0,0 +1,58 @@
+from discord import RawReactionActionEvent, Reaction, User
+from discord.ext import commands
+
+
+class ReactionRouter:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.handlers = {}
+        self.messages = {}
+        self.channels = {}
+        bot.add_listener(self.on_raw_reaction_add)
+        bot.add_listener(self.on_raw_reaction_remove)
+        bot.add_listener(self.on_reaction_add)
+        bot.add_listener(self.on_reaction_remove)
+
+    def register(self, cog: str, event: str, handler):
+        self.handlers[(cog, event)] = handler
+
+    def unregister(self, cog: str):
+        for k in [k for k in self.handlers if k[0] == cog]:
+            del self.handlers[k]
+        for m in [m for m, c in self.messages.items() if c == cog]:
+            del self.messages[m]
+        for c in [c for c, o in self.channels.items() if o == cog]:
+            del self.channels[c]
+
+    def track(self, cog: str, message_id: int):
+        self.messages[message_id] = cog
+
+    def untrack(self, *message_ids: int):
+        for m in message_ids:
+            self.messages.pop(m, None)
+
+    def track_channel(self, cog: str, channel_id: int):
+        self.channels[channel_id] = cog
+
+    def untrack_channel(self, channel_id: int):
+        self.channels.pop(channel_id, None)
+
+    async def dispatch(self, event: str, message_id: int, channel_id: int, *args):
+        owners = {self.messages.get(message_id), self.channels.get(channel_id)}
+        owners.discard(None)
+        for cog in owners:
+            handler = self.handlers.get((cog, event))
+            if handler:
+                await handler(*args)
+
+    async def on_raw_reaction_add(self, payload: RawReactionActionEvent):
+        await self.dispatch("raw_reaction_add", payload.message_id, payload.channel_id, payload)
+
+    async def on_raw_reaction_remove(self, payload: RawReactionActionEvent):
+        await self.dispatch("raw_reaction_remove", payload.message_id, payload.channel_id, payload)
+
+    async def on_reaction_add(self, reaction: Reaction, user: User):
+        await self.dispatch("reaction_add", reaction.message.id, reaction.message.channel.id, reaction, user)
+
+    async def on_reaction_remove(self, reaction: Reaction, user: User):
+        await self.dispatch("reaction_remove", reaction.message.id, reaction.message.channel.id, reaction, user)
@@ -0,0 +1,59 @@
+import heapq
+from asyncio import AbstractEventLoop, Event, TimeoutError, wait_for
+from datetime import datetime
+
+
+class Scheduler:
+    def __init__(self, callback):
+        self.callback = callback
+        self.heap = []
+        self.entries = {}
+        self.wakeup = Event()
+        self.task = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def push(self, key, date: datetime):
+        self.entries[key] = date
+        heapq.heappush(self.heap, (date, key))
+        if self.heap[0][1] == key:
+            self.wakeup.set()
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+
+    def next(self):
+        while self.heap and self.entries.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else None
+
+    def start(self, loop: AbstractEventLoop):
+        self.task = loop.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            entry = self.next()
+            if not entry:
+                await self.wakeup.wait()
+                continue
+
+            delay = (entry[0] - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await wait_for(self.wakeup.wait(), delay)
+                except TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            del self.entries[entry[1]]
+            self.callback(entry[1])
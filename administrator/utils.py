@@ -1,14 +1,18 @@
 import re
+from asyncio import Semaphore, gather
 from datetime import timedelta
+from functools import partial
 
-from discord import Message
+from discord import Message, PartialEmoji, HTTPException
+from discord.ext import commands
 from discord.ext.commands import BadArgument
-from sqlalchemy.orm import Session
 
 import db
 
 
 msg_url_re = re.compile(r"^https://.*discord.*\.com/channels/[0-9]+/([0-9+]+)/([0-9]+)$")
+# Interaction response type acknowledging a slash command while the answer is sent as a normal message
+ACK_WITH_SOURCE = 5
 
 
 async def get_message_by_url(ctx, url: str) -> Message:
@@ -27,6 +31,36 @@ async def get_message_by_url(ctx, url: str) -> Message:
     return m
 
 
+async def remove_reaction(bot: commands.Bot, channel_id: int, message_id: int, emoji, user_id: int):
+    if isinstance(emoji, PartialEmoji):
+        emoji = emoji._as_reaction()
+    await bot.http.remove_reaction(channel_id, message_id, emoji, user_id)
+
+
+async def run_limited(jobs: list, progress=None, concurrency: int = 10) -> list:
+    semaphore = Semaphore(concurrency)
+    done = 0
+
+    async def run(job):
+        nonlocal done
+        async with semaphore:
+            try:
+                result = await job()
+            except HTTPException as e:
+                result = e
+        done += 1
+        if progress:
+            await progress(done, len(jobs))
+        return result
+
+    return await gather(*map(run, jobs))
+
+
+async def edit_members(members: list, progress=None, concurrency: int = 10, **fields) -> int:
+    results = await run_limited([partial(m.edit, **fields) for m in members], progress, concurrency)
+    return len([r for r in results if not isinstance(r, HTTPException)])
+
+
 def time_pars(s: str) -> timedelta:
     match = re.fullmatch(r"(?:([0-9]+)W)*(?:([0-9]+)D)*(?:([0-9]+)H)*(?:([0-9]+)M)*(?:([0-9]+)S)*",
                          s.upper().replace(" ", "").strip())
@@ -48,17 +82,29 @@ def seconds_to_time_string(seconds: float) -> str:
     if minutes > 0 else f"{seconds}s"}"""
 
 
-def event_is_enabled(cog: str, guild_id: int, s: Session = None) -> bool:
-    close = False
-    if not s:
-        s = db.Session()
-        close = True
+extension_states = {}
+
+
+async def load_extension_states(guild_id: int = None):
+    def load(s) -> list:
+        q = s.query(db.ExtensionState)
+        if guild_id:
+            q = q.filter(db.ExtensionState.guild_id == guild_id)
+        return q.all()
+
+    states = await db.run(load)
+    if guild_id:
+        forget_extension_states(guild_id)
+    else:
+        extension_states.clear()
+    for es in states:
+        extension_states[(es.extension_name, es.guild_id)] = es.state
+
 
-    es = s.query(db.ExtensionState).get((cog, guild_id))
+def forget_extension_states(guild_id: int):
+    for k in [k for k in extension_states if k[1] == guild_id]:
+        del extension_states[k]
 
-    if close or (es and not es.state):
-        s.close()
 
-    if es:
-        return es.state
-    return True
+def event_is_enabled(cog: str, guild_id: int) -> bool:
+    return extension_states.get((cog, guild_id), True)
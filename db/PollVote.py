@@ -0,0 +1,14 @@
+from db import Base
+from sqlalchemy import Column, BigInteger, String
+
+
+class PollVote(Base):
+    __tablename__ = "poll_votes"
+    poll = Column(BigInteger, primary_key=True)
+    user = Column(BigInteger, primary_key=True)
+    choice = Column(String, primary_key=True)
+
+    def __init__(self, poll: int, user: int, choice: str):
+        self.poll = poll
+        self.user = user
+        self.choice = choice
@@ -1,21 +1,22 @@
 from db import Base
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean
+from sqlalchemy import Column, Integer, BigInteger, Boolean, JSON
 
 
 class Polls(Base):
     __tablename__ = "polls"
     id = Column(Integer, primary_key=True)
     message = Column(BigInteger, nullable=False, unique=True)
-    channel = Column(BigInteger, nullable=False)
-    guild = Column(BigInteger, nullable=False)
+    channel = Column(BigInteger, nullable=False, index=True)
+    guild = Column(BigInteger, nullable=False, index=True)
     author = Column(BigInteger, nullable=False)
-    reactions = Column(String, nullable=False)
+    reactions = Column(JSON, nullable=False)
     multi = Column(Boolean, nullable=False, default=False)
+    legacy = Column(Boolean)
 
     def __init__(self, message: int, channel: int, guild: int, author: int, reactions: [str], multi: bool = False):
         self.message = message
         self.channel = channel
         self.guild = guild
         self.author = author
-        self.reactions = str(reactions)
+        self.reactions = reactions
         self.multi = multi
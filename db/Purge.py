@@ -0,0 +1,23 @@
+from db import Base
+from sqlalchemy import Column, Integer, BigInteger
+
+
+class Purge(Base):
+    __tablename__ = "purges"
+    id = Column(Integer, primary_key=True)
+    guild = Column(BigInteger, nullable=False)
+    channel = Column(BigInteger, nullable=False)
+    user = Column(BigInteger, nullable=False)
+    start = Column(BigInteger, nullable=False)
+    end = Column(BigInteger, nullable=False, unique=True)
+    cursor = Column(BigInteger, nullable=False)
+    deleted = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, guild: int, channel: int, user: int, start: int, end: int):
+        self.guild = guild
+        self.channel = channel
+        self.user = user
+        self.start = start
+        self.end = end
+        self.cursor = start
+        self.deleted = 0
@@ -1,5 +1,5 @@
 from db import Base
-from sqlalchemy import Column, Integer, BigInteger, Boolean, Text
+from sqlalchemy import Column, Integer, BigInteger, Boolean, Index, JSON
 
 
 class RoRec(Base):
@@ -7,18 +7,22 @@ class RoRec(Base):
     id = Column(Integer, primary_key=True)
     message = Column(BigInteger, nullable=False, unique=True)
     channel = Column(BigInteger, name=False)
-    guild = Column(BigInteger, nullable=False)
+    guild = Column(BigInteger, nullable=False, index=True)
     one = Column(Boolean, nullable=False, default=False)
-    data = Column(Text, nullable=False, default="{}")
+    data = Column(JSON, nullable=False)
 
     def __init__(self, message: int, channel: int, guild: int, one: bool = False):
         self.message = message
         self.channel = channel
         self.guild = guild
         self.one = one
+        self.data = {}
 
     def get_data(self) -> dict:
-        return eval(self.data)
+        return dict(self.data)
 
     def set_data(self, data: dict):
-        self.data = str(data)
+        self.data = data
+
+
+Index("ix_rorec_channel", RoRec.channel)
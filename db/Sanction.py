@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from db import Base
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+
+
+class Sanction(Base):
+    __tablename__ = "sanctions"
+    id = Column(Integer, primary_key=True)
+    guild = Column(BigInteger, nullable=False)
+    user = Column(BigInteger, nullable=False)
+    action = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __init__(self, guild: int, user: int, action: str, expires_at: datetime):
+        self.guild = guild
+        self.user = user
+        self.action = action
+        self.expires_at = expires_at
@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from db import Base
+from sqlalchemy import Column, Integer, DateTime
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    date = Column(DateTime, nullable=False)
+
+    def __init__(self, version: int, date: datetime = None):
+        self.version = version
+        self.date = date if date else datetime.now()
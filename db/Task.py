@@ -7,9 +7,9 @@ class Task(Base):
     __tablename__ = "tasks"
     id = Column(Integer, primary_key=True)
     message = Column(String, nullable=False)
-    user = Column(BigInteger, nullable=False)
+    user = Column(BigInteger, nullable=False, index=True)
     channel = Column(BigInteger, nullable=False)
-    date = Column(DateTime, nullable=False)
+    date = Column(DateTime, nullable=False, index=True)
     creation_date = Column(DateTime, nullable=False, default=datetime.now())
 
     def __init__(self, message: str, user: int, channel: int, date: datetime, creation_date: datetime = None):
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from db import Base
-from sqlalchemy import Column, BigInteger, String, DateTime
+from sqlalchemy import Column, BigInteger, String, DateTime, Integer
 
 
 class Tomuss(Base):
@@ -9,6 +9,11 @@ class Tomuss(Base):
     user_id = Column(BigInteger, primary_key=True)
     url = Column(String, nullable=False)
     last = Column(DateTime, nullable=False)
+    etag = Column(String)
+    modified = Column(String)
+    next_poll = Column(DateTime, index=True)
+    poll_interval = Column(Integer)
+    failures = Column(Integer)
 
     def __init__(self, user_id: int, url: str, last: datetime):
         self.user_id = user_id
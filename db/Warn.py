@@ -3,11 +3,12 @@ from datetime import datetime
 from discord import Embed
 
 from db import Base
-from sqlalchemy import Column, Integer, BigInteger, Text, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Text, DateTime, Index
 
 
 class Warn(Base):
     __tablename__ = "warns"
+    __table_args__ = (Index("ix_warns_guild_user", "guild", "user"),)
     id = Column(Integer, primary_key=True)
     user = Column(BigInteger, nullable=False)
     author = Column(BigInteger, nullable=False)
@@ -1,11 +1,12 @@
 from datetime import timedelta
 
 from db import Base
-from sqlalchemy import Column, Integer, BigInteger, String
+from sqlalchemy import Column, Integer, BigInteger, String, Index
 
 
 class WarnAction(Base):
     __tablename__ = "warn_actions"
+    __table_args__ = (Index("ix_warn_actions_guild_count", "guild", "count"),)
     id = Column(Integer, primary_key=True)
     guild = Column(BigInteger, nullable=False)
     count = Column(Integer, nullable=False, unique=True)
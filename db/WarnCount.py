@@ -0,0 +1,14 @@
+from db import Base
+from sqlalchemy import Column, Integer, BigInteger
+
+
+class WarnCount(Base):
+    __tablename__ = "warn_counts"
+    guild = Column(BigInteger, primary_key=True)
+    user = Column(BigInteger, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, guild: int, user: int, count: int = 0):
+        self.guild = guild
+        self.user = user
+        self.count = count
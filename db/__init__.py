@@ -1,3 +1,6 @@
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+
 from administrator.config import config
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -7,17 +10,37 @@ args = {"pool_pre_ping": True, "pool_recycle": 3600}
 if not db.startswith("sqlite:"):
     args.update({"pool_size": 0, "max_overflow": -1})
 engine = create_engine(db, **args)
-Session = sessionmaker(bind=engine)
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+executor = ThreadPoolExecutor(max_workers=config.get("db_workers", 4), thread_name_prefix="db")
 Base = declarative_base()
+
+
+async def run(func, *args):
+    def call():
+        s = Session()
+        try:
+            return func(s, *args)
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+    return await get_event_loop().run_in_executor(executor, call)
+
+
 from db.Task import Task
 from db.Greetings import Greetings
 from db.Presentation import Presentation
 from db.RoRec import RoRec
 from db.Polls import Polls
+from db.PollVote import PollVote
 from db.Warn import Warn
 from db.WarnAction import WarnAction
+from db.WarnCount import WarnCount
+from db.Sanction import Sanction
 from db.InviteRole import InviteRole
 from db.Tomuss import Tomuss
 from db.PCP import PCP
+from db.Purge import Purge
 from db.Extension import Extension, ExtensionState
-Base.metadata.create_all(engine)
+from db.SchemaVersion import SchemaVersion
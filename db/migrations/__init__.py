@@ -0,0 +1,69 @@
+import re
+from datetime import datetime
+from importlib import import_module
+from pkgutil import iter_modules
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+
+import db
+from administrator.logger import logger
+
+logger = logger.getChild("migrations")
+migration_re = re.compile(r"v([0-9]+)_[a-z0-9_]+")
+
+
+def get_migrations() -> list:
+    migrations = []
+    for m in iter_modules(__path__):
+        match = migration_re.fullmatch(m.name)
+        if match:
+            migrations.append((int(match.group(1)), import_module(f"{__name__}.{m.name}")))
+    return sorted(migrations, key=lambda m: m[0])
+
+
+def head() -> int:
+    migrations = get_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current(connection: Connection):
+    if not db.engine.dialect.has_table(connection, db.SchemaVersion.__tablename__):
+        return None
+    return connection.execute(select([func.max(db.SchemaVersion.version)])).scalar() or 0
+
+
+def stamp(connection: Connection, version: int):
+    db.SchemaVersion.__table__.create(connection, checkfirst=True)
+    connection.execute(db.SchemaVersion.__table__.delete().where(db.SchemaVersion.version >= version))
+    connection.execute(db.SchemaVersion.__table__.insert().values(version=version, date=datetime.now()))
+
+
+def add_column(connection: Connection, model, name: str):
+    column = CreateColumn(model.__table__.c[name]).compile(dialect=connection.dialect)
+    connection.execute(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column}")
+
+
+def upgrade(target: int = None):
+    with db.engine.begin() as connection:
+        version = current(connection)
+        if version is None:
+            if db.engine.dialect.has_table(connection, db.Extension.__tablename__):
+                logger.info("Existing database without schema version, stamping as version 0")
+                version = 0
+                stamp(connection, version)
+            else:
+                logger.info("Empty database, creating the schema")
+                db.Base.metadata.create_all(connection)
+                stamp(connection, head())
+                return
+
+    for v, m in get_migrations():
+        if v <= version or (target is not None and v > target):
+            continue
+        logger.info(f"Upgrading to version {v}: {m.description}")
+        with db.engine.begin() as connection:
+            m.upgrade(connection)
+            stamp(connection, v)
+    logger.info("Database up to date")
@@ -0,0 +1,20 @@
+from sqlalchemy.engine import Connection
+
+import db
+
+description = "Index the columns used by hot lookups"
+indexes = [
+    (db.Warn, "ix_warns_guild_user"),
+    (db.WarnAction, "ix_warn_actions_guild_count"),
+    (db.Task, "ix_tasks_date"),
+    (db.Task, "ix_tasks_user"),
+    (db.Polls, "ix_polls_channel"),
+    (db.Polls, "ix_polls_guild"),
+    (db.RoRec, "ix_rorec_channel"),
+    (db.RoRec, "ix_rorec_guild"),
+]
+
+
+def upgrade(connection: Connection):
+    for model, name in indexes:
+        next(filter(lambda i: i.name == name, model.__table__.indexes)).create(connection)
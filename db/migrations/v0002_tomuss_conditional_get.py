@@ -0,0 +1,11 @@
+from sqlalchemy.engine import Connection
+
+import db
+from db.migrations import add_column
+
+description = "Store the ETag and Last-Modified of each Tomuss feed"
+
+
+def upgrade(connection: Connection):
+    add_column(connection, db.Tomuss, "etag")
+    add_column(connection, db.Tomuss, "modified")
@@ -0,0 +1,12 @@
+from sqlalchemy.engine import Connection
+
+import db
+from db.migrations import add_column
+
+description = "Store the polling schedule of each Tomuss feed"
+
+
+def upgrade(connection: Connection):
+    for name in ["next_poll", "poll_interval", "failures"]:
+        add_column(connection, db.Tomuss, name)
+    next(filter(lambda i: i.name == "ix_tomuss_next_poll", db.Tomuss.__table__.indexes)).create(connection)
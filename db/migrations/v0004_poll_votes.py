@@ -0,0 +1,9 @@
+from sqlalchemy.engine import Connection
+
+import db
+
+description = "Store poll votes"
+
+
+def upgrade(connection: Connection):
+    db.PollVote.__table__.create(connection)
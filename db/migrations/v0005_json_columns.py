@@ -0,0 +1,17 @@
+from ast import literal_eval
+from json import dumps
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+description = "Store polls reactions and rorec data as JSON"
+columns = [("polls", "reactions"), ("rorec", "data")]
+
+
+def upgrade(connection: Connection):
+    for table, column in columns:
+        for i, value in connection.execute(text(f"SELECT id, {column} FROM {table}")).fetchall():
+            connection.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"),
+                               value=dumps(literal_eval(value)), id=i)
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSON USING {column}::json"))
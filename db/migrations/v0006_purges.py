@@ -0,0 +1,9 @@
+from sqlalchemy.engine import Connection
+
+import db
+
+description = "Store running purges"
+
+
+def upgrade(connection: Connection):
+    db.Purge.__table__.create(connection)
@@ -0,0 +1,13 @@
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+
+import db
+
+description = "Maintain a warn counter per guild member"
+
+
+def upgrade(connection: Connection):
+    db.WarnCount.__table__.create(connection)
+    connection.execute(db.WarnCount.__table__.insert().from_select(
+        ["guild", "user", "count"],
+        select([db.Warn.guild, db.Warn.user, func.count()]).group_by(db.Warn.guild, db.Warn.user)))
@@ -0,0 +1,9 @@
+from sqlalchemy.engine import Connection
+
+import db
+
+description = "Store timed warn sanctions"
+
+
+def upgrade(connection: Connection):
+    db.Sanction.__table__.create(connection)
@@ -0,0 +1,21 @@
+from datetime import timezone
+
+from discord.utils import snowflake_time
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+import db
+from db.migrations import add_column
+
+description = "Mark the polls created before vote tracking"
+
+
+def upgrade(connection: Connection):
+    add_column(connection, db.Polls, "legacy")
+    tracked = connection.execute(select([db.SchemaVersion.date]).where(db.SchemaVersion.version == 4)).scalar()
+    if not tracked:
+        return
+    tracked = tracked.astimezone(timezone.utc).replace(tzinfo=None)
+    legacy = [i for i, m in connection.execute(select([db.Polls.id, db.Polls.message])) if snowflake_time(m) < tracked]
+    if legacy:
+        connection.execute(db.Polls.__table__.update().where(db.Polls.id.in_(legacy)).values(legacy=True))
@@ -10,6 +10,7 @@ import db
 from administrator import slash
 from administrator.check import has_permissions
 from administrator.logger import logger
+from administrator.utils import extension_states, load_extension_states, forget_extension_states
 
 
 extension_name = "extension"
@@ -20,6 +21,11 @@ class Extension(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         slash.get_cog_commands(self)
+        if self.bot.loop.is_running():
+            self.bot.loop.create_task(load_extension_states())
+        else:
+            # Loaded before the bot connects: fill the cache before the gateway dispatches any event
+            self.bot.loop.run_until_complete(load_extension_states())
 
     def description(self):
         return "Manage bot's extensions"
@@ -27,11 +33,10 @@ class Extension(commands.Cog):
     @cog_ext.cog_subcommand(base="extension", name="list", description="List all enabled extensions")
     @has_permissions(administrator=True)
     async def extension_list(self, ctx: SlashContext):
-        s = db.Session()
         embed = Embed(title="Extensions list")
-        for es in s.query(db.ExtensionState).filter(db.ExtensionState.guild_id == ctx.guild.id):
+        for es in await db.run(lambda s: s.query(db.ExtensionState)
+                               .filter(db.ExtensionState.guild_id == ctx.guild.id).all()):
             embed.add_field(name=es.extension_name, value="Enable" if es.state else "Disable")
-        s.close()
         await ctx.send(embeds=[embed])
 
     @cog_ext.cog_subcommand(base="extension",
@@ -41,18 +46,18 @@ class Extension(commands.Cog):
                                                                    SlashCommandOptionType.STRING, True)])
     @has_permissions(administrator=True)
     async def extension_enable(self, ctx: SlashContext, name: str):
-        s = db.Session()
-        es = s.query(db.ExtensionState).get((name, ctx.guild.id))
-        if not es:
-            raise BadArgument()
-        elif es.state:
-            message = "Extension already enabled"
-        else:
+        def set_state(s):
+            es = s.query(db.ExtensionState).get((name, ctx.guild.id))
+            if not es:
+                raise BadArgument()
+            elif es.state:
+                return "Extension already enabled"
             es.state = True
             s.add(es)
             s.commit()
-            s.close()
-            message = "\U0001f44d"
+            return "\U0001f44d"
+        message = await db.run(set_state)
+        extension_states[(name, ctx.guild.id)] = True
         await ctx.send(content=message)
 
     @cog_ext.cog_subcommand(base="extension",
@@ -62,18 +67,18 @@ class Extension(commands.Cog):
                                                                    SlashCommandOptionType.STRING, True)])
     @has_permissions(administrator=True)
     async def extension_disable(self, ctx: SlashContext, name: str):
-        s = db.Session()
-        es = s.query(db.ExtensionState).get((name, ctx.guild.id))
-        if not es:
-            raise BadArgument()
-        elif not es.state:
-            message = "Extension already disabled"
-        else:
+        def set_state(s):
+            es = s.query(db.ExtensionState).get((name, ctx.guild.id))
+            if not es:
+                raise BadArgument()
+            elif not es.state:
+                return "Extension already disabled"
             es.state = False
             s.add(es)
             s.commit()
-            s.close()
-            message = "\U0001f44d"
+            return "\U0001f44d"
+        message = await db.run(set_state)
+        extension_states[(name, ctx.guild.id)] = False
         await ctx.send(content=message)
 
     @commands.group("extension", pass_context=True)
@@ -124,34 +129,38 @@ class Extension(commands.Cog):
 
     @commands.Cog.listener()
     async def on_ready(self):
-        s = db.Session()
-        for guild in self.bot.guilds:
-            for extension in filter(lambda x: x not in ["Extension", "Help"], self.bot.cogs):
-                e = s.query(db.Extension).get(extension)
-                if not e:
-                    s.add(db.Extension(extension))
-                    s.commit()
-                es = s.query(db.ExtensionState).get((extension, guild.id))
-                if not es:
-                    s.add(db.ExtensionState(extension, guild.id))
-                    s.commit()
-        s.close()
+        def register(s, guilds: list, extensions: list):
+            for guild in guilds:
+                for extension in extensions:
+                    e = s.query(db.Extension).get(extension)
+                    if not e:
+                        s.add(db.Extension(extension))
+                        s.commit()
+                    es = s.query(db.ExtensionState).get((extension, guild))
+                    if not es:
+                        s.add(db.ExtensionState(extension, guild))
+                        s.commit()
+        await db.run(register, [g.id for g in self.bot.guilds],
+                     list(filter(lambda x: x not in ["Extension", "Help"], self.bot.cogs)))
+        await load_extension_states()
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild: Guild):
-        s = db.Session()
-        for extension in s.query(db.Extension).all():
-            s.add(db.ExtensionState(extension.name, guild.id))
-        s.commit()
-        s.close()
+        def register(s):
+            for extension in s.query(db.Extension).all():
+                s.add(db.ExtensionState(extension.name, guild.id))
+            s.commit()
+        await db.run(register)
+        await load_extension_states(guild.id)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: Guild):
-        s = db.Session()
-        for es in s.query(db.ExtensionState).filter(db.ExtensionState.guild_id == guild.id):
-            s.delete(es)
-        s.commit()
-        s.close()
+        def unregister(s):
+            for es in s.query(db.ExtensionState).filter(db.ExtensionState.guild_id == guild.id):
+                s.delete(es)
+            s.commit()
+        await db.run(unregister)
+        forget_extension_states(guild.id)
 
     def cog_unload(self):
         slash.remove_cog_commands(self)
@@ -1,9 +1,14 @@
+from asyncio import sleep
+from collections import deque
+from time import monotonic
+
 from discord.ext import commands
-from discord import Member, Embed, Forbidden
+from discord import Member, Forbidden, Guild
 from discord_slash import cog_ext, SlashContext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
 
 from administrator.check import is_enabled, guild_only, has_permissions
+from administrator.config import config
 from administrator.logger import logger
 from administrator import db, slash
 from administrator.utils import event_is_enabled
@@ -11,16 +16,28 @@ from administrator.utils import event_is_enabled
 
 extension_name = "greetings"
 logger = logger.getChild(extension_name)
+FLOOD_RATE = config.get("greetings_flood_rate", 20)
+SUMMARY_DELAY = config.get("greetings_summary_delay", 30)
+SUMMARY_SIZE = 20
 
 
 class Greetings(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.greetings = {}
+        self.joins = {}
+        self.summaries = {}
         slash.get_cog_commands(self)
+        self.bot.loop.create_task(self.load_greetings())
 
     def description(self):
         return "Setup join and leave message"
 
+    async def load_greetings(self):
+        # Only the rows are cached: `str.format` on the message is cheaper than rendering a pre-parsed template
+        for m in await db.run(lambda s: s.query(db.Greetings).all()):
+            self.greetings[m.guild] = m
+
     @cog_ext.cog_subcommand(base="greetings", name="set",
                             description="Set the greetings message\n`{}` will be replace by the username",
                             options=[
@@ -35,14 +52,16 @@ class Greetings(commands.Cog):
     @guild_only()
     @has_permissions(manage_guild=True)
     async def greetings_set(self, ctx: SlashContext, message_type: str, message: str):
-        s = db.Session()
-        m = s.query(db.Greetings).filter(db.Greetings.guild == ctx.guild.id).first()
-        if not m:
-            m = db.Greetings(ctx.guild.id)
-            s.add(m)
-        setattr(m, message_type+"_enable", True)
-        setattr(m, message_type+"_message", message.replace("\\n", '\n'))
-        s.commit()
+        def set_message(s):
+            m = s.query(db.Greetings).filter(db.Greetings.guild == ctx.guild.id).first()
+            if not m:
+                m = db.Greetings(ctx.guild.id)
+                s.add(m)
+            setattr(m, message_type+"_enable", True)
+            setattr(m, message_type+"_message", message.replace("\\n", '\n'))
+            s.commit()
+            return m
+        self.greetings[ctx.guild.id] = await db.run(set_message)
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="greetings", name="show",
@@ -55,9 +74,7 @@ class Greetings(commands.Cog):
     @guild_only()
     @has_permissions(manage_guild=True)
     async def greetings_show(self, ctx: SlashContext, message_type: str):
-        s = db.Session()
-        m = s.query(db.Greetings).filter(db.Greetings.guild == ctx.guild.id).first()
-        s.close()
+        m = self.greetings.get(ctx.guild.id)
         if not m:
             await ctx.send(content=f"No {message_type} message set !")
         else:
@@ -76,40 +93,85 @@ class Greetings(commands.Cog):
     @guild_only()
     @has_permissions(manage_guild=True)
     async def greetings_toggle(self, ctx: SlashContext, message_type: str):
-        s = db.Session()
-        m = s.query(db.Greetings).filter(db.Greetings.guild == ctx.guild.id).first()
+        def toggle(s):
+            m = s.query(db.Greetings).filter(db.Greetings.guild == ctx.guild.id).first()
+            if m:
+                setattr(m, message_type+"_enable", not getattr(m, message_type+"_enable"))
+                s.commit()
+            return m
+        m = await db.run(toggle)
+        if m:
+            self.greetings[ctx.guild.id] = m
         if not m:
             await ctx.send(content=f"No {message_type} message set !")
         else:
-            setattr(m, message_type+"_enable", not getattr(m, message_type+"_enable"))
-            s.commit()
             await ctx.send(content=f"{message_type.title()} message is " +
                                    ("enable" if getattr(m, message_type+"_enable") else "disable"))
-        s.close()
 
     @commands.Cog.listener()
     async def on_member_join(self, member: Member):
-        s = db.Session()
-        if not event_is_enabled(self.qualified_name, member.guild.id, s):
+        if not event_is_enabled(self.qualified_name, member.guild.id):
+            return
+        m = self.greetings.get(member.guild.id)
+        if not m:
             return
-        m = s.query(db.Greetings).filter(db.Greetings.guild == member.guild.id).first()
-        s.close()
-        if m and m.join_enable:
+        joins = self.joins.get(member.guild.id)
+        if joins is None:
+            joins = self.joins[member.guild.id] = deque()
+        joins.append(monotonic())
+        self.trim_joins(joins)
+        if m.join_enable:
             embed = m.join_embed(member.guild.name, str(member))
             try:
                 await member.send(embed=embed)
             except Forbidden:
-                await member.guild.system_channel.send(member.mention, embed=embed)
+                if self.flooded(member.guild.id):
+                    self.summarize(member.guild, 0, member)
+                elif member.guild.system_channel:
+                    await member.guild.system_channel.send(member.mention, embed=embed)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: Member):
-        s = db.Session()
-        if not event_is_enabled(self.qualified_name, member.guild.id, s):
+        if not event_is_enabled(self.qualified_name, member.guild.id):
             return
-        m = s.query(db.Greetings).filter(db.Greetings.guild == member.guild.id).first()
-        s.close()
+        m = self.greetings.get(member.guild.id)
         if m and m.leave_enable:
-            await member.guild.system_channel.send(m.leave_msg(str(member)))
+            if self.flooded(member.guild.id):
+                self.summarize(member.guild, 1, member)
+            elif member.guild.system_channel:
+                await member.guild.system_channel.send(m.leave_msg(str(member)))
+
+    def flooded(self, guild_id: int) -> bool:
+        joins = self.joins.get(guild_id)
+        if not joins:
+            return False
+        self.trim_joins(joins)
+        return len(joins) > FLOOD_RATE
+
+    @staticmethod
+    def trim_joins(joins: deque):
+        while joins and monotonic() - joins[0] > 60:
+            joins.popleft()
+
+    def summarize(self, guild: Guild, kind: int, member: Member):
+        summary = self.summaries.get(guild.id)
+        if not summary:
+            summary = self.summaries[guild.id] = ([], [])
+            self.bot.loop.create_task(self.send_summary(guild))
+        summary[kind].append(member)
+
+    async def send_summary(self, guild: Guild):
+        await sleep(SUMMARY_DELAY)
+        joins, leaves = self.summaries.pop(guild.id)
+        m = self.greetings.get(guild.id)
+        if not m or not guild.system_channel:
+            return
+        for i in range(0, len(joins), SUMMARY_SIZE):
+            members = joins[i:i+SUMMARY_SIZE]
+            await guild.system_channel.send(" ".join(map(lambda x: x.mention, members)),
+                                            embed=m.join_embed(guild.name, ", ".join(map(str, members))))
+        for i in range(0, len(leaves), SUMMARY_SIZE):
+            await guild.system_channel.send(m.leave_msg(", ".join(map(str, leaves[i:i+SUMMARY_SIZE]))))
 
     def cog_unload(self):
         slash.remove_cog_commands(self)
@@ -1,4 +1,6 @@
 import re
+from asyncio import Lock, current_task
+from collections import deque
 
 from discord import Embed, Member, Guild, Role, CategoryChannel
 from discord.abc import GuildChannel
@@ -23,13 +25,23 @@ channel_mention_re = re.compile(r"<#[0-9]+>")
 class Invite(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.invites = {}
+        self.roles = {}
+        self.uses = {}
+        self.unclaimed = {}
+        self.locks = {}
+        self.refreshes = {}
         slash.get_cog_commands(self)
-        self.bot.loop.create_task(self.update_invites())
+        self.bot.loop.create_task(self.load_invites())
 
     def description(self):
         return "Get role from a special invite link"
 
+    async def load_invites(self):
+        for i in await db.run(lambda s: s.query(db.InviteRole).all()):
+            self.roles.setdefault(i.guild_id, {})[i.invite_code] = i.role_id
+        await self.bot.wait_until_ready()
+        await self.update_invites()
+
     @is_enabled()
     @guild_only()
     @has_permissions(administrator=True)
@@ -37,10 +49,13 @@ class Invite(commands.Cog):
         if isinstance(channel, CategoryChannel):
             raise BadArgument()
         inv = await channel.create_invite()
-        s = db.Session()
-        s.add(db.InviteRole(ctx.guild.id, inv.code, role.id))
-        s.commit()
-        s.close()
+
+        def add(s):
+            s.add(db.InviteRole(ctx.guild.id, inv.code, role.id))
+            s.commit()
+        await db.run(add)
+        self.roles.setdefault(ctx.guild.id, {})[inv.code] = role.id
+        self.uses.setdefault(ctx.guild.id, {})[inv.code] = inv.uses
         await ctx.send(content=f"Invite created: `{inv.url}`")
 
     @cog_ext.cog_subcommand(base="invite", name="delete", description="Remove a invite", options=[
@@ -53,20 +68,49 @@ class Invite(commands.Cog):
         if not inv:
             raise BadArgument()
 
-        s = db.Session()
-        invite_role = s.query(db.InviteRole).get({"guild_id": ctx.guild.id, "invite_code": code})
-        if not invite_role:
-            s.close()
-            raise BadArgument()
-        s.delete(invite_role)
-        s.commit()
-        s.close()
+        def delete(s):
+            invite_role = s.query(db.InviteRole).get({"guild_id": ctx.guild.id, "invite_code": code})
+            if not invite_role:
+                raise BadArgument()
+            s.delete(invite_role)
+            s.commit()
+        await db.run(delete)
+        self.forget_invite(ctx.guild.id, code)
         await inv.delete()
         await ctx.send(content="\U0001f44d")
 
+    def forget_invite(self, guild_id: int, code: str):
+        self.roles.get(guild_id, {}).pop(code, None)
+        self.uses.get(guild_id, {}).pop(code, None)
+
     async def update_invites(self):
         for g in self.bot.guilds:
-            self.invites[g.id] = await g.invites()
+            if self.roles.get(g.id):
+                await self.refresh_invites(g)
+
+    def refresh(self, guild: Guild):
+        task = self.refreshes.get(guild.id)
+        if not task:
+            task = self.refreshes[guild.id] = self.bot.loop.create_task(self.refresh_invites(guild))
+        return task
+
+    async def refresh_invites(self, guild: Guild):
+        lock = self.locks.get(guild.id)
+        if not lock:
+            lock = self.locks[guild.id] = Lock()
+        async with lock:
+            if self.refreshes.get(guild.id) is current_task():
+                del self.refreshes[guild.id]
+            invites = await guild.invites()
+
+        roles = self.roles.get(guild.id, {})
+        uses = self.uses.setdefault(guild.id, {})
+        unclaimed = self.unclaimed.setdefault(guild.id, deque())
+        for i in invites:
+            if i.code in roles:
+                if uses.get(i.code) is not None and i.uses > uses[i.code]:
+                    unclaimed.extend([i.code] * (i.uses - uses[i.code]))
+                uses[i.code] = i.uses
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -76,50 +120,45 @@ class Invite(commands.Cog):
     async def on_member_join(self, member: Member):
         if not event_is_enabled(self.qualified_name, member.guild.id):
             return
-        user_invites = await member.guild.invites()
-        for i in self.invites[member.guild.id]:
-            for ui in user_invites:
-                if i.code == ui.code and i.uses < ui.uses:
-                    s = db.Session()
-                    invite_role = s.query(db.InviteRole).get({"guild_id": member.guild.id, "invite_code": i.code})
-                    s.close()
-                    if invite_role:
-                        try:
-                            await member.add_roles(member.guild.get_role(invite_role.role_id))
-                        except Forbidden:
-                            pass
-        self.invites[member.guild.id] = user_invites
-
-    @commands.Cog.listener()
-    async def on_invite_create(self, invite):
-        if not event_is_enabled(self.qualified_name, invite.guild.id):
+        if not self.roles.get(member.guild.id):
             return
-        self.invites[invite.guild.id] = await invite.guild.invites()
+        await self.refresh(member.guild)
+        unclaimed = self.unclaimed.get(member.guild.id)
+        if unclaimed:
+            role = self.roles.get(member.guild.id, {}).get(unclaimed.popleft())
+            if role:
+                try:
+                    await member.add_roles(member.guild.get_role(role))
+                except Forbidden:
+                    pass
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite):
-        s = db.Session()
-        if not event_is_enabled(self.qualified_name, invite.guild.id, s):
+        if not event_is_enabled(self.qualified_name, invite.guild.id):
+            return
+        if invite.code not in self.roles.get(invite.guild.id, {}):
             return
-        invite_role = s.query(db.InviteRole).get({"guild_id": invite.guild.id, "invite_code": invite.code})
-        if invite_role:
-            s.delete(invite_role)
-            s.commit()
-        s.close()
-        self.invites[invite.guild.id] = await invite.guild.invites()
 
-    @commands.Cog.listener()
-    async def on_guild_join(self, guild: Guild):
-        self.invites[guild.id] = await guild.invites()
+        def delete(s):
+            invite_role = s.query(db.InviteRole).get({"guild_id": invite.guild.id, "invite_code": invite.code})
+            if invite_role:
+                s.delete(invite_role)
+                s.commit()
+        await db.run(delete)
+        self.forget_invite(invite.guild.id, invite.code)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: Guild):
-        s = db.Session()
-        for g in s.query(db.InviteRole).filter(db.InviteRole.guild_id == guild.id).all():
-            s.delete(g)
-        s.commit()
-        s.close()
-        del self.invites[guild.id]
+        def delete(s):
+            for g in s.query(db.InviteRole).filter(db.InviteRole.guild_id == guild.id).all():
+                s.delete(g)
+            s.commit()
+        await db.run(delete)
+        self.roles.pop(guild.id, None)
+        self.uses.pop(guild.id, None)
+        self.unclaimed.pop(guild.id, None)
+        self.locks.pop(guild.id, None)
+        self.refreshes.pop(guild.id, None)
 
 
 def setup(bot):
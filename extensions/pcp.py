@@ -1,6 +1,9 @@
 import re
+from asyncio import TimeoutError
+from functools import partial
+from time import monotonic
 
-from discord import Member, Role, Embed
+from discord import Member, Role, Embed, HTTPException, CategoryChannel, PermissionOverwrite
 from discord.ext import commands
 from discord.ext.commands import BadArgument
 from discord_slash import cog_ext, SlashCommandOptionType, SlashContext
@@ -9,47 +12,65 @@ from discord_slash.utils import manage_commands
 import db
 from administrator import slash
 from administrator.check import guild_only, has_permissions
+from administrator.config import config
 from administrator.logger import logger
-from administrator.utils import get_message_by_url
+from administrator.utils import get_message_by_url, run_limited
 
 extension_name = "PCP"
 logger = logger.getChild(extension_name)
+CONCURRENCY = config.get("pcp_concurrency", 10)
 
 
 class PCP(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.patterns = {}
         slash.get_cog_commands(self)
 
     def description(self):
         return "PCP Univ Lyon 1"
 
+    @staticmethod
+    def compile(roles_re: str, start_role_re: str = None) -> tuple:
+        try:
+            return re.compile(roles_re), re.compile(start_role_re) if start_role_re else None
+        except re.error:
+            raise BadArgument()
+
+    async def get_patterns(self, guild_id: int):
+        if guild_id not in self.patterns:
+            p = await db.run(lambda s: s.query(db.PCP).get(guild_id))
+            self.patterns[guild_id] = self.compile(p.roles_re, p.start_role_re) if p else None
+        return self.patterns[guild_id]
+
     @cog_ext.cog_subcommand(base="pcp", name="join", description="Join your group", options=[
         manage_commands.create_option("group", "The target group to join", SlashCommandOptionType.ROLE, True)])
     @guild_only()
     async def pcp(self, ctx: SlashContext, role: Role):
-        s = db.Session()
-        p = s.query(db.PCP).get(ctx.guild.id)
-        s.close()
-        if p and re.fullmatch(p.roles_re, role.name.upper()):
+        patterns = await self.get_patterns(ctx.guild.id)
+        if patterns and patterns[0].fullmatch(role.name.upper()):
+            roles_re, start_role_re = patterns
             await ctx.send(content="\U000023f3")
 
-            async def roles() -> list:
-                return list(filter(
-                    lambda r: re.fullmatch(p.roles_re, r.name.upper()) or
-                    (p.start_role_re and re.fullmatch(p.start_role_re, r.name.upper())),
-                    (await ctx.guild.fetch_member(ctx.author.id)).roles
-                ))
-
-            if not role or role.name in map(lambda r: r.name, await roles()):
+            member: Member = ctx.author
+            groups = [r for r in member.roles if roles_re.fullmatch(r.name.upper()) or
+                      (start_role_re and start_role_re.fullmatch(r.name.upper()))]
+            if role.name in map(lambda r: r.name, groups):
                 await ctx.delete()
                 raise BadArgument()
 
-            while await roles():
-                await ctx.author.remove_roles(*(await roles()))
-
-            while role not in (await ctx.guild.fetch_member(ctx.author.id)).roles:
-                await ctx.author.add_roles(role)
+            update = self.bot.loop.create_task(self.bot.wait_for(
+                "member_update", check=lambda b, a: a.id == member.id and role in a.roles, timeout=10))
+            try:
+                await member.edit(roles=[r for r in member.roles[1:] if r not in groups] + [role])
+            except HTTPException:
+                update.cancel()
+                raise
+            try:
+                await update
+            except TimeoutError:
+                if role not in (await ctx.guild.fetch_member(member.id)).roles:
+                    raise BadArgument()
             await ctx.edit(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="pcp", name="pin", description="Pin a message with the url", options=[
@@ -101,29 +122,68 @@ class PCP(commands.Cog):
                             description="Check all text channel permissions to reapply vocal permissions")
     @has_permissions(administrator=True)
     async def pcp_group_fix_vocal(self, ctx: SlashContext):
-        s = db.Session()
-        p = s.query(db.PCP).get(ctx.guild.id)
-        s.close()
-        if not p:
+        patterns = await self.get_patterns(ctx.guild.id)
+        if not patterns:
             raise BadArgument()
 
-        message = "\U000023f3"
-        await ctx.send(content=message)
-        for cat in filter(lambda c: re.fullmatch(p.roles_re, c.name.upper()), ctx.guild.categories):
-            message += f"\n{cat.name}..."
-            await ctx.edit(content=message)
-            teachers = []
-            for t in cat.text_channels:
-                for p in t.overwrites:
-                    if isinstance(p, Member):
-                        teachers.append(p)
+        jobs = []
+        for cat in filter(lambda c: patterns[0].fullmatch(c.name.upper()), ctx.guild.categories):
             voc = next(filter(lambda c: c.name == "vocal-1", cat.voice_channels), None)
+            if not voc:
+                continue
+            teachers = {p for t in cat.text_channels for p in t.overwrites if isinstance(p, Member)}
             for t in teachers:
-                await voc.set_permissions(t, view_channel=True)
-            message += f"\n{cat.name} done"
-            await ctx.edit(content=message)
-        message += "\n\U0001f44d"
-        await ctx.edit(content=message)
+                if not voc.overwrites_for(t).view_channel:
+                    jobs.append(partial(voc.set_permissions, t, view_channel=True))
+
+        await ctx.send(content="\U000023f3")
+        await self.provision(ctx, jobs)
+
+    @staticmethod
+    async def provision(ctx: SlashContext, jobs: list):
+        last = monotonic()
+
+        async def progress(done: int, total: int):
+            nonlocal last
+            if done != total and monotonic() - last >= 2:
+                last = monotonic()
+                await ctx.edit(content=f"\U000023f3 {done}/{total}")
+
+        failed = [r for r in await run_limited(jobs, progress, CONCURRENCY) if isinstance(r, HTTPException)]
+        for e in failed:
+            logger.warning(f"Fail to provision a channel on {ctx.guild.id}: {e}")
+        await ctx.edit(content=f"\u274C {len(failed)}/{len(jobs)} failed" if failed else "\U0001f44d")
+
+    @staticmethod
+    def plan_subjects(cat: CategoryChannel, names: list, teacher: Member = None) -> list:
+        jobs = []
+        channels = {c.name.upper(): c for c in cat.text_channels}
+        subjects = {}
+        for name in names:
+            subjects.setdefault(name.upper(), name)
+        for name in subjects.values():
+            chan = channels.get(name.upper())
+            if not chan:
+                if teacher:
+                    overwrites = dict(cat.overwrites)
+                    overwrites[teacher] = PermissionOverwrite(read_messages=True)
+                    jobs.append(partial(cat.create_text_channel, name, overwrites=overwrites))
+                else:
+                    jobs.append(partial(cat.create_text_channel, name))
+            elif teacher and not chan.overwrites_for(teacher).read_messages:
+                jobs.append(partial(chan.set_permissions, teacher, read_messages=True))
+
+        voc = next(filter(lambda c: c.name == "vocal-1", cat.voice_channels), None)
+        if not voc:
+            if teacher:
+                overwrites = dict(cat.overwrites)
+                overwrites[teacher] = PermissionOverwrite(view_channel=True)
+                jobs.append(partial(cat.create_voice_channel, "vocal-1", overwrites=overwrites))
+            else:
+                jobs.append(partial(cat.create_voice_channel, "vocal-1"))
+        elif teacher and not voc.overwrites_for(teacher).view_channel:
+            jobs.append(partial(voc.set_permissions, teacher, view_channel=True))
+        return jobs
 
     @cog_ext.cog_subcommand(base="pcp", subcommand_group="group", name="set", description="Set regex for group role",
                             options=[
@@ -134,30 +194,33 @@ class PCP(commands.Cog):
                             ])
     @has_permissions(administrator=True)
     async def pcp_group_set(self, ctx: SlashContext, roles_re: str, start_role_re: str = None):
-        s = db.Session()
-        p = s.query(db.PCP).get(ctx.guild.id)
-        if p:
-            p.roles_re = roles_re.upper()
-            p.start_role_re = start_role_re.upper() if start_role_re else None
-        else:
-            p = db.PCP(ctx.guild.id, roles_re.upper(), start_role_re.upper() if start_role_re else None)
-        s.add(p)
-        s.commit()
-        s.close()
+        patterns = self.compile(roles_re.upper(), start_role_re.upper() if start_role_re else None)
+
+        def set_group(s):
+            p = s.query(db.PCP).get(ctx.guild.id)
+            if p:
+                p.roles_re = roles_re.upper()
+                p.start_role_re = start_role_re.upper() if start_role_re else None
+            else:
+                p = db.PCP(ctx.guild.id, roles_re.upper(), start_role_re.upper() if start_role_re else None)
+            s.add(p)
+            s.commit()
+        await db.run(set_group)
+        self.patterns[ctx.guild.id] = patterns
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="pcp", subcommand_group="group", name="unset",
                             description="Unset regex for group role")
     @has_permissions(administrator=True)
     async def pcp_group_unset(self, ctx: commands.Context):
-        s = db.Session()
-        p = s.query(db.PCP).get(ctx.guild.id)
-        if not p:
-            s.close()
-            raise BadArgument()
-        s.delete(p)
-        s.commit()
-        s.close()
+        def unset_group(s):
+            p = s.query(db.PCP).get(ctx.guild.id)
+            if not p:
+                raise BadArgument()
+            s.delete(p)
+            s.commit()
+        await db.run(unset_group)
+        self.patterns[ctx.guild.id] = None
         await ctx.message.add_reaction("\U0001f44d")
 
     @cog_ext.cog_subcommand(base="pcp", subcommand_group="subject", name="add", description="Add a subject to a group",
@@ -179,17 +242,8 @@ class PCP(commands.Cog):
         if not cat:
             raise BadArgument()
 
-        chan = next(filter(lambda c: c.name.upper() == name.upper(), cat.text_channels), None)
-        if not chan:
-            chan = await cat.create_text_channel(name)
-        voc = next(filter(lambda c: c.name == "vocal-1", cat.voice_channels), None)
-        if not voc:
-            voc = await cat.create_voice_channel("vocal-1")
-        if teacher:
-            await chan.set_permissions(teacher, read_messages=True)
-            await voc.set_permissions(teacher, view_channel=True)
-
-        await ctx.send(content="\U0001f44d")
+        await ctx.send(content="\U000023f3")
+        await self.provision(ctx, self.plan_subjects(cat, [name], teacher))
 
     @cog_ext.cog_subcommand(base="pcp", subcommand_group="subject", name="bulk",
                             description="Remove a subject to a group", options=[
@@ -198,8 +252,12 @@ class PCP(commands.Cog):
         ])
     @has_permissions(administrator=True)
     async def pcp_group_subject_bulk(self, ctx: SlashContext, group: Role, names: str):
-        for n in names.split(" "):
-            await self.pcp_group_subject_add.invoke(ctx, n, group)
+        cat = next(filter(lambda c: c.name.upper() == group.name.upper(), ctx.guild.categories), None)
+        if not cat:
+            raise BadArgument()
+
+        await ctx.send(content="\U000023f3")
+        await self.provision(ctx, self.plan_subjects(cat, [n for n in names.split(" ") if n]))
 
     @cog_ext.cog_subcommand(base="pcp", subcommand_group="subject", name="remove",description="Bulk subject add",
                             options=[
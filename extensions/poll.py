@@ -1,4 +1,6 @@
 import shlex
+from asyncio import sleep
+from collections import Counter
 from datetime import datetime
 
 from discord.abc import GuildChannel
@@ -9,10 +11,10 @@ from discord_slash import cog_ext, SlashCommandOptionType, SlashContext
 from discord_slash.utils import manage_commands
 
 import db
-from administrator import slash
+from administrator import slash, router
 from administrator.check import is_enabled, guild_only
 from administrator.logger import logger
-from administrator.utils import event_is_enabled
+from administrator.utils import event_is_enabled, remove_reaction
 
 extension_name = "poll"
 logger = logger.getChild(extension_name)
@@ -25,11 +27,52 @@ REACTIONS.append("\U0001F51F")
 class Poll(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.polls = {}
+        self.votes = {}
+        self.legacy = set()
+        self.dirty = set()
+        self.flushing = False
         slash.get_cog_commands(self)
+        router.register(self.qualified_name, "raw_reaction_add", self.reaction_add)
+        router.register(self.qualified_name, "raw_reaction_remove", self.reaction_remove)
+        self.bot.loop.create_task(self.load_polls())
 
     def description(self):
         return "Create poll with a simple command"
 
+    async def load_polls(self):
+        def load(s) -> tuple:
+            return s.query(db.Polls).all(), s.query(db.PollVote).all()
+
+        polls, votes = await db.run(load)
+        for p in polls:
+            self.add_poll(p)
+        for v in votes:
+            if v.poll in self.votes:
+                self.votes[v.poll].setdefault(v.user, set()).add(v.choice)
+        self.legacy.update(p.message for p in polls if p.legacy)
+
+    def add_poll(self, poll: db.Polls):
+        self.polls[poll.message] = poll
+        self.votes[poll.message] = {}
+        router.track(self.qualified_name, poll.message)
+
+    def remove_polls(self, *messages: int):
+        for m in messages:
+            self.polls.pop(m, None)
+            self.votes.pop(m, None)
+            self.legacy.discard(m)
+        router.untrack(*messages)
+
+    @staticmethod
+    def delete_polls(session: db.Session, polls: list) -> list:
+        messages = [p.message for p in polls]
+        for p in polls:
+            session.delete(p)
+        session.query(db.PollVote).filter(db.PollVote.poll.in_(messages)).delete(synchronize_session=False)
+        session.commit()
+        return messages
+
     @cog_ext.cog_slash(name="poll",
                        description="Create a poll",
                        options=[
@@ -56,91 +99,123 @@ class Poll(commands.Cog):
             reactions = REACTIONS[0:len(choices)] + ["\U0001F5D1"]
             for reaction in reactions:
                 await message.add_reaction(reaction)
-            s = db.Session()
-            s.add(db.Polls(message.id, ctx.channel.id, ctx.guild.id, ctx.author.id, reactions, multi))
-            s.commit()
-            s.close()
 
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: RawReactionActionEvent):
+            def add(s) -> db.Polls:
+                p = db.Polls(message.id, ctx.channel.id, ctx.guild.id, ctx.author.id, reactions, multi)
+                s.add(p)
+                s.commit()
+                return p
+            self.add_poll(await db.run(add))
+
+    async def reaction_add(self, payload: RawReactionActionEvent):
+        p = self.polls.get(payload.message_id)
+        if not p or payload.user_id == self.bot.user.id:
+            return
+
         if not payload.member:
-            user = await self.bot.fetch_user(payload.user_id)
+            user = self.bot.get_user(payload.user_id) or await self.bot.fetch_user(payload.user_id)
         else:
             user = payload.member
 
         if not user.bot:
-            s = db.Session()
-            if payload.guild_id and not event_is_enabled(self.qualified_name, payload.guild_id, s):
+            if payload.guild_id and not event_is_enabled(self.qualified_name, payload.guild_id):
                 return
-            p = s.query(db.Polls).filter(db.Polls.message == payload.message_id).first()
-            if p:
-                message = await self.bot.get_channel(p.channel).fetch_message(p.message)
-                if str(payload.emoji) not in eval(p.reactions):
-                    await message.remove_reaction(payload.emoji, user)
-                elif str(payload.emoji) == "\U0001F5D1":
-                    if user.id != p.author:
-                        await message.remove_reaction(payload.emoji, user)
-                    else:
-                        await self.close_poll(s, p)
-                elif not p.multi:
-                    f = False
-                    for r in message.reactions:
-                        if str(r.emoji) != str(payload.emoji):
-                            async for u in r.users():
-                                if u == user:
-                                    await r.remove(user)
-                                    f = True
-                                    break
-                            if f:
-                                break
-            s.close()
-
-    async def close_poll(self, session: db.Session, poll: db.Polls):
+            emoji = str(payload.emoji)
+            if emoji not in p.reactions:
+                await remove_reaction(self.bot, p.channel, p.message, payload.emoji, user.id)
+            elif emoji == "\U0001F5D1":
+                if user.id != p.author:
+                    await remove_reaction(self.bot, p.channel, p.message, payload.emoji, user.id)
+                else:
+                    await self.close_poll(p)
+            else:
+                votes = self.votes[p.message].setdefault(user.id, set())
+                previous = votes - {emoji} if not p.multi else set()
+                votes.difference_update(previous)
+                votes.add(emoji)
+                self.vote_changed(p.message, user.id)
+                for e in previous:
+                    await remove_reaction(self.bot, p.channel, p.message, e, user.id)
+
+    async def reaction_remove(self, payload: RawReactionActionEvent):
+        votes = self.votes.get(payload.message_id, {}).get(payload.user_id)
+        if votes and str(payload.emoji) in votes:
+            votes.discard(str(payload.emoji))
+            self.vote_changed(payload.message_id, payload.user_id)
+
+    def vote_changed(self, poll: int, user: int):
+        self.dirty.add((poll, user))
+        if not self.flushing:
+            self.flushing = True
+            self.bot.loop.create_task(self.flush_votes())
+
+    async def flush_votes(self):
+        def save(s, votes: dict):
+            for (poll, user), choices in votes.items():
+                s.query(db.PollVote).filter(db.PollVote.poll == poll, db.PollVote.user == user)\
+                    .delete(synchronize_session=False)
+                for c in choices:
+                    s.add(db.PollVote(poll, user, c))
+            s.commit()
+
+        try:
+            while self.dirty:
+                await sleep(1)
+                votes = {(p, u): set(self.votes[p].get(u, [])) for p, u in self.dirty if p in self.votes}
+                self.dirty.clear()
+                await db.run(save, votes)
+        finally:
+            self.flushing = False
+
+    async def close_poll(self, poll: db.Polls):
         time = datetime.now()
+        votes = self.votes.get(poll.message, {})
+        counts = Counter(c for choices in votes.values() for c in choices)
+        legacy = poll.message in self.legacy
+        self.remove_polls(poll.message)
+
         message = await self.bot.get_channel(poll.channel).fetch_message(poll.message)
-        reactions = message.reactions
+        if legacy:
+            counts = Counter({str(r.emoji): r.count-1 for r in message.reactions})
         await message.clear_reactions()
         embed = message.embeds[0]
         for i, f in enumerate(embed.fields):
-            embed.set_field_at(i, name=f"{f.name} - {reactions[i].count-1}", value=f.value, inline=False)
+            embed.set_field_at(i, name=f"{f.name} - {counts[f.name]}", value=f.value, inline=False)
         embed.set_footer(text=embed.footer.text + "\n" + f"Close: {time.strftime('%d/%m/%Y %H:%M')}")
         await message.edit(embed=embed)
-        session.delete(poll)
-        session.commit()
+        await db.run(self.delete_polls, [poll])
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, message: RawMessageDeleteEvent):
-        s = db.Session()
-        p = s.query(db.Polls).filter(db.Polls.message == message.message_id).first()
-        if p:
-            s.delete(p)
-            s.commit()
-        s.close()
+        if message.message_id in self.polls:
+            p = self.polls[message.message_id]
+            self.remove_polls(p.message)
+            await db.run(self.delete_polls, [p])
 
     @commands.Cog.listener()
     async def on_raw_bulk_message_delete(self, messages: RawBulkMessageDeleteEvent):
-        s = db.Session()
-        for p in s.query(db.Polls).filter(db.Polls.message.in_(messages.message_ids)).all():
-            s.delete(p)
-        s.commit()
-        s.close()
+        ps = [self.polls[m] for m in messages.message_ids if m in self.polls]
+        if ps:
+            self.remove_polls(*[p.message for p in ps])
+            await db.run(self.delete_polls, ps)
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: GuildChannel):
         if isinstance(channel, TextChannel):
-            s = db.Session()
-            for p in s.query(db.Polls).filter(db.Polls.channel == channel.id).all():
-                s.delete(p)
-            s.commit()
-            s.close()
+            ps = [p for p in self.polls.values() if p.channel == channel.id]
+            if ps:
+                self.remove_polls(*[p.message for p in ps])
+                await db.run(self.delete_polls, ps)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: Guild):
-        s = db.Session()
-        for p in s.query(db.Polls).filter(db.Polls.guild == guild.id).all():
-            s.delete(p)
-        s.commit()
-        s.close()
+        ps = [p for p in self.polls.values() if p.guild == guild.id]
+        if ps:
+            self.remove_polls(*[p.message for p in ps])
+            await db.run(self.delete_polls, ps)
+
+    def cog_unload(self):
+        router.unregister(self.qualified_name)
 
 
 def setup(bot):
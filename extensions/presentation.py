@@ -1,6 +1,6 @@
 from discord.abc import GuildChannel
 from discord.ext import commands
-from discord import Message, Role, TextChannel
+from discord import Message, Role, TextChannel, Member
 from discord.ext.commands import BadArgument
 from discord_slash import cog_ext, SlashCommandOptionType, SlashContext
 from discord_slash.utils import manage_commands
@@ -17,11 +17,18 @@ logger = logger.getChild(extension_name)
 class Presentation(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.presentations = {}
         slash.get_cog_commands(self)
+        self.bot.loop.create_task(self.load_presentations())
 
     def description(self):
         return "Give role to user who make a presentation in a dedicated channel"
 
+    async def load_presentations(self):
+        for guild, channel, role in await db.run(lambda s: s.query(db.Presentation.guild, db.Presentation.channel,
+                                                                     db.Presentation.role).all()):
+            self.presentations[guild] = (channel, role)
+
     @cog_ext.cog_subcommand(base="presentation", name="set",
                             description="Set the presentation channel and the role to give",
                             options=[
@@ -36,15 +43,18 @@ class Presentation(commands.Cog):
     async def presentation_set(self, ctx: SlashContext, channel: GuildChannel, role: Role):
         if not isinstance(channel, TextChannel):
             raise BadArgument()
-        s = db.Session()
-        p = s.query(db.Presentation).filter(db.Presentation.guild == ctx.guild.id).first()
-        if not p:
-            p = db.Presentation(ctx.guild.id, channel.id, role.id)
-            s.add(p)
-        else:
-            p.channel = channel.id
-            p.role = role.id
-        s.commit()
+
+        def set_presentation(s):
+            p = s.query(db.Presentation).filter(db.Presentation.guild == ctx.guild.id).first()
+            if not p:
+                p = db.Presentation(ctx.guild.id, channel.id, role.id)
+                s.add(p)
+            else:
+                p.channel = channel.id
+                p.role = role.id
+            s.commit()
+        await db.run(set_presentation)
+        self.presentations[ctx.guild.id] = (channel.id, role.id)
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="presentation", name="disable", description="Disable the auto role give")
@@ -52,26 +62,26 @@ class Presentation(commands.Cog):
     @guild_only()
     @has_permissions(manage_guild=True)
     async def presentation_disable(self, ctx: SlashContext):
-        s = db.Session()
-        p = s.query(db.Presentation).filter(db.Presentation.guild == ctx.guild.id).first()
-        if not p:
+        def disable(s):
+            p = s.query(db.Presentation).filter(db.Presentation.guild == ctx.guild.id).first()
+            if p:
+                s.delete(p)
+                s.commit()
+            return p
+        self.presentations.pop(ctx.guild.id, None)
+        if not await db.run(disable):
             await ctx.send(content="Nothing to disable !")
         else:
-            s.delete(p)
-            s.commit()
             await ctx.send(content="\U0001f44d")
-        s.close()
 
     @commands.Cog.listener()
     async def on_message(self, message: Message):
         if message.guild is not None:
-            s = db.Session()
-            if not event_is_enabled(self.qualified_name, message.guild.id, s):
+            p = self.presentations.get(message.guild.id)
+            if not p or p[0] != message.channel.id or not event_is_enabled(self.qualified_name, message.guild.id):
                 return
-            p = s.query(db.Presentation).filter(db.Presentation.guild == message.guild.id).first()
-            s.close()
-            if p and p.channel == message.channel.id and p.role not in map(lambda x: x.id, message.author.roles):
-                await message.author.add_roles(message.guild.get_role(p.role), reason="Presentation done")
+            if isinstance(message.author, Member) and p[1] not in map(lambda x: x.id, message.author.roles):
+                await message.author.add_roles(message.guild.get_role(p[1]), reason="Presentation done")
 
 
 def setup(bot):
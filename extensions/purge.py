@@ -1,23 +1,34 @@
 from asyncio import sleep
+from datetime import datetime, timedelta
+from time import monotonic
 
 from discord.ext import commands
-from discord import Embed, RawReactionActionEvent
+from discord import RawReactionActionEvent, Message, Object, HTTPException, NotFound
+from discord.utils import snowflake_time
 from discord_slash import SlashContext, cog_ext
 
-from administrator import slash
+from administrator import db, slash, router
 from administrator.check import is_enabled, guild_only, has_permissions
+from administrator.config import config
 from administrator.logger import logger
 from administrator.utils import event_is_enabled
 
 extension_name = "purge"
 logger = logger.getChild(extension_name)
+CHUNK = 100
+DELETE_DELAY = config.get("purge_delete_delay", 1)
 
 
 class Purge(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.purges = {}
+        self.jobs = {}
+        self.cancelled = set()
+        self.stopping = False
         slash.get_cog_commands(self)
+        router.register(self.qualified_name, "raw_reaction_add", self.reaction_add)
+        self.bot.loop.create_task(self.resume_jobs())
 
     def description(self):
         return "Purge all messages between the command and the next add reaction"
@@ -28,28 +39,145 @@ class Purge(commands.Cog):
     @has_permissions(manage_messages=True)
     async def purge(self, ctx: SlashContext):
         message = await ctx.channel.send(content="\U0001f44d")
-        self.purges[ctx.author.id] = message
+        self.add_purge(ctx.author.id, message)
 
         await sleep(2*60)
         if ctx.author.id in self.purges and self.purges[ctx.author.id] == message:
             await message.delete()
-            del self.purges[ctx.author.id]
-
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: RawReactionActionEvent):
-        if payload.guild_id:
-            if not event_is_enabled(self.qualified_name, payload.guild_id):
-                return
-            user = self.bot.get_user(payload.user_id)
-            message = await self.bot.get_guild(payload.guild_id).get_channel(payload.channel_id)\
-                .fetch_message(payload.message_id)
-            if user.id in self.purges:
-                if message.channel == self.purges[user.id].channel:
-                    async with message.channel.typing():
-                        await message.channel.purge(before=self.purges[user.id], after=message, limit=None)
-                        await self.purges[user.id].delete()
-                        await message.delete()
-                        del self.purges[user.id]
+            self.remove_purge(ctx.author.id)
+
+    def add_purge(self, user_id: int, message: Message):
+        if user_id in self.purges:
+            self.remove_purge(user_id)
+        self.purges[user_id] = message
+        router.track_channel(self.qualified_name, message.channel.id)
+
+    def remove_purge(self, user_id: int):
+        message = self.purges.pop(user_id, None)
+        if not message:
+            return
+        channel = message.channel
+        if not any(m.channel == channel for m in self.purges.values()):
+            router.untrack_channel(channel.id)
+
+    async def resume_jobs(self):
+        await self.bot.wait_until_ready()
+        for job in await db.run(lambda s: s.query(db.Purge).all()):
+            logger.info(f"Resuming purge {job.id} on {job.channel}")
+            self.start_job(job)
+
+    def start_job(self, job: db.Purge):
+        self.jobs[job.end] = job
+        router.track(self.qualified_name, job.end)
+        self.bot.loop.create_task(self.run_job(job))
+
+    def stopped(self, job: db.Purge) -> bool:
+        return self.stopping or job.end in self.cancelled
+
+    async def reaction_add(self, payload: RawReactionActionEvent):
+        if not payload.guild_id or not event_is_enabled(self.qualified_name, payload.guild_id):
+            return
+
+        job = self.jobs.get(payload.message_id)
+        if job:
+            if str(payload.emoji) == "\u274C" and payload.user_id == job.user:
+                self.cancelled.add(job.end)
+            return
+
+        if payload.user_id not in self.purges or self.purges[payload.user_id].channel.id != payload.channel_id:
+            return
+        end = self.purges[payload.user_id]
+        self.remove_purge(payload.user_id)
+        job = db.Purge(payload.guild_id, payload.channel_id, payload.user_id, payload.message_id, end.id)
+
+        def add(s):
+            s.add(job)
+            s.commit()
+        await db.run(add)
+        await end.edit(content="\U0001f5d1 Purging... react \u274C to cancel")
+        await end.add_reaction("\u274C")
+        self.start_job(job)
+
+    async def run_job(self, job: db.Purge):
+        channel = self.bot.get_channel(job.channel)
+        if not channel:
+            await self.finish_job(job)
+            return
+
+        last = monotonic()
+        try:
+            while not self.stopped(job):
+                messages = await channel.history(limit=CHUNK, after=Object(job.cursor), before=Object(job.end),
+                                                 oldest_first=True).flatten()
+                if not messages:
+                    break
+                if not await self.delete_chunk(channel.id, [m.id for m in messages], job):
+                    break
+
+                job.cursor = messages[-1].id
+                job.deleted += len(messages)
+
+                def save(s):
+                    s.merge(job)
+                    s.commit()
+                await db.run(save)
+
+                if monotonic() - last >= 2:
+                    last = monotonic()
+                    await self.set_status(job, f"\U0001f5d1 {job.deleted} messages deleted... react \u274C to cancel")
+        except HTTPException as e:
+            logger.error(f"Purge {job.id} failed on {job.channel}: {e}")
+            await self.finish_job(job)
+            await self.set_status(job, f"\u274C Purge failed after {job.deleted} messages")
+            return
+
+        if self.stopping:
+            return
+        elif job.end in self.cancelled:
+            await self.finish_job(job)
+            await self.set_status(job, f"\u274C Purge cancelled after {job.deleted} messages")
+        else:
+            await self.finish_job(job)
+            await self.delete_chunk(channel.id, [job.start, job.end])
+
+    async def set_status(self, job: db.Purge, content: str):
+        try:
+            await self.bot.http.edit_message(job.channel, job.end, content=content)
+        except HTTPException as e:
+            logger.warning(f"Fail to update purge {job.id} status: {e}")
+
+    async def delete_chunk(self, channel_id: int, ids: list, job: db.Purge = None) -> bool:
+        limit = datetime.utcnow() - timedelta(days=14) + timedelta(minutes=5)
+        recent = [i for i in ids if snowflake_time(i) > limit]
+        old = [i for i in ids if snowflake_time(i) <= limit]
+
+        if len(recent) > 1:
+            await self.bot.http.delete_messages(channel_id, recent, reason="Purge")
+        else:
+            old.extend(recent)
+
+        for i in old:
+            if job and self.stopped(job):
+                return False
+            try:
+                await self.bot.http.delete_message(channel_id, i, reason="Purge")
+            except NotFound:
+                pass
+            await sleep(DELETE_DELAY)
+        return True
+
+    async def finish_job(self, job: db.Purge):
+        def delete(s):
+            s.query(db.Purge).filter(db.Purge.id == job.id).delete()
+            s.commit()
+        await db.run(delete)
+        self.jobs.pop(job.end, None)
+        self.cancelled.discard(job.end)
+        router.untrack(job.end)
+
+    def cog_unload(self):
+        router.unregister(self.qualified_name)
+        self.stopping = True
 
 
 def setup(bot):
@@ -1,25 +1,44 @@
-from datetime import datetime
+from asyncio import Lock, Semaphore, sleep, TimeoutError
+from collections import deque
+from datetime import datetime, timedelta
+from weakref import WeakValueDictionary
 
+from aiohttp import ClientError
 from discord.ext import commands
-from discord import Embed
+from discord import Embed, HTTPException, Forbidden, NotFound
 from discord.ext.commands import BadArgument
-from discord.ext import tasks
 from discord_slash import SlashContext, cog_ext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
 
 from administrator.check import is_enabled
+from administrator.config import config
 from administrator.logger import logger
 from administrator import db, slash
+from administrator.scheduler import Scheduler
 from administrator.utils import time_pars, seconds_to_time_string
 
 extension_name = "reminders"
 logger = logger.getChild(extension_name)
+RETRIES = 5
+RETRY_DELAY = 1
+REQUEUES = config.get("reminder_requeues", 10)
 
 
 class Reminders(commands.Cog, name="Reminder"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.scheduler = Scheduler(self.reminder_due)
+        self.channels = {}
+        self.requeues = {}
+        self.locks = WeakValueDictionary()
+        self.semaphore = Semaphore(config.get("reminder_concurrency", 5))
+        self.pending = 0
+        self.delivered = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=100)
         slash.get_cog_commands(self)
+        self.scheduler.start(self.bot.loop)
+        self.bot.loop.create_task(self.load_tasks())
 
     def description(self):
         return "Create and manage reminders"
@@ -32,10 +51,15 @@ class Reminders(commands.Cog, name="Reminder"):
     async def reminder_add(self, ctx: SlashContext, message: str, time: str):
         time = time_pars(time)
         now = datetime.now()
-        s = db.Session()
-        s.add(db.Task(message, ctx.author.id, ctx.channel.id, now + time, datetime.now()))
-        s.commit()
-        s.close()
+
+        def add(s) -> db.Task:
+            t = db.Task(message, ctx.author.id, ctx.channel.id, now + time, datetime.now())
+            s.add(t)
+            s.commit()
+            return t
+        t = await db.run(add)
+        self.channels[t.id] = t.channel
+        self.scheduler.push(t.id, t.date)
 
         await ctx.send(content=f"""Remind you in {seconds_to_time_string(time.total_seconds())} !""")
 
@@ -43,10 +67,8 @@ class Reminders(commands.Cog, name="Reminder"):
     @is_enabled()
     async def reminder_list(self, ctx: SlashContext):
         embed = Embed(title="Tasks list")
-        s = db.Session()
-        for t in s.query(db.Task).filter(db.Task.user == ctx.author.id).all():
+        for t in await db.run(lambda s: s.query(db.Task).filter(db.Task.user == ctx.author.id).all()):
             embed.add_field(name=f"N°{t.id} | {t.date.strftime('%d/%m/%Y %H:%M')}", value=f"{t.message}", inline=False)
-        s.close()
         await ctx.send(embeds=[embed])
 
     @cog_ext.cog_subcommand(base="reminder", name="remove", description="Remove the task withe the matching id",
@@ -55,44 +77,110 @@ class Reminders(commands.Cog, name="Reminder"):
                                                               SlashCommandOptionType.INTEGER, True)])
     @is_enabled()
     async def reminder_remove(self, ctx: SlashContext, n: int):
-        s = db.Session()
-        t = s.query(db.Task).filter(db.Task.id == n).first()
-        if t and t.user == ctx.author.id:
+        def remove(s):
+            t = s.query(db.Task).filter(db.Task.id == n).first()
+            if not t or t.user != ctx.author.id:
+                raise BadArgument()
             s.delete(t)
             s.commit()
-            s.close()
-            await ctx.send(content="\U0001f44d")
-        else:
-            s.close()
-            raise BadArgument()
-
-    @tasks.loop(minutes=1)
-    async def reminders_loop(self):
-        s = db.Session()
-        for t in s.query(db.Task).filter(db.Task.date <= datetime.now()).all():
-            self.bot.loop.create_task(self.reminder_exec(t))
-            s.delete(t)
-
-        s.commit()
-        s.close()
+        await db.run(remove)
+        self.scheduler.remove(n)
+        self.channels.pop(n, None)
+        self.requeues.pop(n, None)
+        await ctx.send(content="\U0001f44d")
+
+    @commands.group("reminder", pass_context=True)
+    async def reminder(self, ctx: commands.Context):
+        pass
+
+    @reminder.group("stats", pass_context=True)
+    @commands.is_owner()
+    async def reminder_stats(self, ctx: commands.Context):
+        embed = Embed(title="Reminders delivery")
+        embed.add_field(name="Scheduled", value=str(len(self.scheduler)))
+        embed.add_field(name="Queued", value=str(self.pending))
+        embed.add_field(name="Delivered", value=str(self.delivered))
+        embed.add_field(name="Failed", value=str(self.failed))
+        if self.latencies:
+            embed.add_field(name="Latency",
+                            value=f"avg {round(sum(self.latencies)/len(self.latencies), 2)}s | "
+                                  f"max {round(max(self.latencies), 2)}s")
+        await ctx.send(embed=embed)
+
+    async def load_tasks(self):
+        for i, date, channel in await db.run(lambda s: s.query(db.Task.id, db.Task.date, db.Task.channel).all()):
+            self.channels[i] = channel
+            self.scheduler.push(i, date)
+
+    def reminder_due(self, task_id: int):
+        channel = self.channels.pop(task_id, None)
+        lock = self.locks.get(channel)
+        if not lock:
+            lock = self.locks[channel] = Lock()
+        self.pending += 1
+        self.bot.loop.create_task(self.reminder_deliver(task_id, lock))
+
+    async def reminder_deliver(self, task_id: int, lock: Lock):
+        async with lock:
+            self.pending -= 1
+            await self.bot.wait_until_ready()
+            task = await db.run(lambda s: s.query(db.Task).get(task_id))
+            if not task:
+                self.requeues.pop(task_id, None)
+                return
+
+            if not self.bot.get_channel(task.channel) or not self.bot.get_user(task.user):
+                logger.warning(f"Dropping reminder {task.id}: channel or user not found")
+                self.failed += 1
+            elif not await self.reminder_send(task):
+                self.failed += 1
+                requeues = self.requeues.get(task.id, 0)
+                if requeues < REQUEUES:
+                    self.requeues[task.id] = requeues + 1
+                    self.channels[task.id] = task.channel
+                    self.scheduler.push(task.id, datetime.now() + timedelta(minutes=min(2**requeues, 60)))
+                    return
+                logger.warning(f"Dropping reminder {task.id}: still failing after {REQUEUES} requeues")
+            self.requeues.pop(task.id, None)
+
+            def delete(s):
+                s.query(db.Task).filter(db.Task.id == task.id).delete()
+                s.commit()
+            await db.run(delete)
+
+    async def reminder_send(self, task: db.Task) -> bool:
+        for attempt in range(RETRIES):
+            try:
+                async with self.semaphore:
+                    await self.reminder_exec(task)
+            except (Forbidden, NotFound) as e:
+                logger.warning(f"Dropping reminder {task.id}: {e}")
+                self.failed += 1
+                return True
+            except (HTTPException, ClientError, TimeoutError) as e:
+                logger.warning(f"Fail to deliver reminder {task.id} (attempt {attempt+1}/{RETRIES}): {e}")
+                await sleep(RETRY_DELAY * 2**attempt)
+            else:
+                self.delivered += 1
+                self.latencies.append((datetime.now() - task.date).total_seconds())
+                return True
+        return False
 
     async def reminder_exec(self, task: db.Task):
         embed = Embed(title="You have a reminder !")
         user = self.bot.get_user(task.user)
         embed.set_author(name=f"{user.name}#{user.discriminator}", icon_url=user.avatar_url)
         embed.add_field(name=str(task.creation_date.strftime('%d/%m/%Y %H:%M')), value=task.message)
-        await (await self.bot.get_channel(task.channel).send(f"{user.mention}", embed=embed)).edit(content="")
+        await self.bot.get_channel(task.channel).send(f"{user.mention}", embed=embed)
 
     def cog_unload(self):
-        self.reminders_loop.stop()
+        self.scheduler.stop()
 
 
 def setup(bot):
     logger.info(f"Loading...")
     try:
-        reminders = Reminders(bot)
-        bot.add_cog(reminders)
-        reminders.reminders_loop.start()
+        bot.add_cog(Reminders(bot))
     except Exception as e:
         logger.error(f"Error loading: {e}")
     else:
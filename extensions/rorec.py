@@ -1,33 +1,55 @@
+from asyncio import gather, Lock
+from time import monotonic
+
 from discord.abc import GuildChannel
 from discord.ext import commands
-from discord import Embed, RawReactionActionEvent, RawBulkMessageDeleteEvent, RawMessageDeleteEvent, NotFound, \
+from discord import Embed, Member, RawReactionActionEvent, RawBulkMessageDeleteEvent, RawMessageDeleteEvent, NotFound, \
     InvalidArgument, HTTPException, TextChannel, Forbidden, Role, Message
 from discord.ext.commands import BadArgument
 from discord_slash import cog_ext, SlashContext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
 
-from administrator import db, slash
+from administrator import db, slash, router
 from administrator.check import is_enabled, guild_only, has_permissions
 from administrator.logger import logger
-from administrator.utils import event_is_enabled, get_message_by_url
+from administrator.utils import event_is_enabled, get_message_by_url, remove_reaction
 
 extension_name = "rorec"
 logger = logger.getChild(extension_name)
+APPLIED_TIMEOUT = 10
 
 
 class RoRec(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.messages = {}
+        self.locks = {}
+        self.clicks = {}
+        self.applied = {}
         slash.get_cog_commands(self)
+        router.register(self.qualified_name, "raw_reaction_add", self.reaction_add)
+        self.bot.loop.create_task(self.load_messages())
 
     def description(self):
         return "Create role-reaction message to give role from a reaction add"
 
-    @staticmethod
-    async def get_message(session: db.Session, ctx: SlashContext, url: str) -> db.RoRec:
-        m = session.query(db.RoRec).filter(db.RoRec.message == (await get_message_by_url(ctx, url)).id and
-                                           db.RoRec.guild == ctx.guild.id).first()
-        if not m:
+    async def load_messages(self):
+        for m in await db.run(lambda s: s.query(db.RoRec).all()):
+            self.add_message(m)
+
+    def add_message(self, m: db.RoRec):
+        self.messages[m.message] = m
+        router.track(self.qualified_name, m.message)
+
+    def remove_messages(self, *messages: int):
+        for m in messages:
+            self.messages.pop(m, None)
+        router.untrack(*messages)
+
+    async def get_message(self, ctx: SlashContext, url: str) -> db.RoRec:
+        message = await get_message_by_url(ctx, url)
+        m = self.messages.get(message.id)
+        if not m or m.guild != ctx.guild.id:
             raise BadArgument()
         else:
             return m
@@ -38,7 +60,7 @@ class RoRec(commands.Cog):
         except (HTTPException, NotFound, InvalidArgument):
             raise BadArgument()
         else:
-            await (await msg.channel.fetch_message(msg.id)).remove_reaction(emoji, self.bot.user)
+            await msg.remove_reaction(emoji, self.bot.user)
 
     @cog_ext.cog_subcommand(base="rorec", name="new",
                             description="Create a new role-reaction message on the mentioned channel",
@@ -64,10 +86,12 @@ class RoRec(commands.Cog):
         embed.add_field(name="Roles", value="No role yet...")
         message = await channel.send(embed=embed)
         r = db.RoRec(message.id, channel.id, ctx.guild.id, one)
-        s = db.Session()
-        s.add(r)
-        s.commit()
-        s.close()
+
+        def add(s):
+            s.add(r)
+            s.commit()
+        await db.run(add)
+        self.add_message(r)
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="rorec", name="edit",
@@ -84,9 +108,7 @@ class RoRec(commands.Cog):
     @guild_only()
     @has_permissions(manage_roles=True)
     async def rorec_edit(self, ctx: SlashContext, url: str, title: str, description: str = ""):
-        s = db.Session()
-        m = await self.get_message(s, ctx, url)
-        s.close()
+        m = await self.get_message(ctx, url)
 
         message = await ctx.guild.get_channel(m.channel).fetch_message(m.message)
         embed: Embed = message.embeds[0]
@@ -110,8 +132,7 @@ class RoRec(commands.Cog):
     @has_permissions(manage_roles=True)
     async def rorec_set(self, ctx: SlashContext, url: str, emoji: str, role: Role):
         await ctx.send(content="\U000023f3")
-        s = db.Session()
-        m = await self.get_message(s, ctx, url)
+        m = await self.get_message(ctx, url)
 
         await ctx.delete()
         msg = await ctx.channel.send("\U000023f3")
@@ -121,8 +142,7 @@ class RoRec(commands.Cog):
         data[emoji] = list(map(lambda x: x.id, [role]))
         m.set_data(data)
         await self.rorec_update(m)
-        s.commit()
-        s.close()
+        await db.run(self.save, m)
         await msg.edit(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="rorec", name="remove",
@@ -138,8 +158,7 @@ class RoRec(commands.Cog):
     @has_permissions(manage_roles=True)
     async def rorec_remove(self, ctx: SlashContext, url: str, emoji: str):
         await ctx.send(content="\U000023f3")
-        s = db.Session()
-        m = await self.get_message(s, ctx, url)
+        m = await self.get_message(ctx, url)
 
         await ctx.delete()
         msg = await ctx.channel.send("\U000023f3")
@@ -152,8 +171,7 @@ class RoRec(commands.Cog):
         m.set_data(data)
 
         await self.rorec_update(m)
-        s.commit()
-        s.close()
+        await db.run(self.save, m)
         await msg.edit("\U0001f44d")
 
     @cog_ext.cog_subcommand(base="rorec", name="reload",
@@ -164,11 +182,9 @@ class RoRec(commands.Cog):
     @guild_only()
     @has_permissions(manage_roles=True)
     async def rorec_reload(self, ctx: SlashContext, url: str):
-        s = db.Session()
-        m = await self.get_message(s, ctx, url)
+        m = await self.get_message(ctx, url)
 
         await self.rorec_update(m)
-        s.close()
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="rorec", name="delete",
@@ -180,99 +196,153 @@ class RoRec(commands.Cog):
     @has_permissions(manage_roles=True)
     async def rorec_delete(self, ctx: SlashContext, url: str):
         msg = await get_message_by_url(ctx, url)
-        s = db.Session()
-        await self.get_message(s, ctx, url)
-        s.close()
+        await self.get_message(ctx, url)
         await msg.delete()
         await ctx.send(content="\U0001f44d")
 
+    @staticmethod
+    def save(session: db.Session, m: db.RoRec):
+        session.query(db.RoRec).filter(db.RoRec.id == m.id).update({db.RoRec.data: m.data},
+                                                                   synchronize_session=False)
+        session.commit()
+
     async def rorec_update(self, m: db.RoRec):
         channel = self.bot.get_channel(m.channel)
         if not channel:
-            pass
+            raise BadArgument()
         message = await channel.fetch_message(m.message)
-        if not message:
-            pass
         embed: Embed = message.embeds[0]
+        old = embed.to_dict()
         name = embed.fields[0].name
         embed.remove_field(0)
         value = ""
         data = m.get_data()
-        await message.clear_reactions()
         for d in data:
             value += f"{d}: "
             value += ", ".join(map(lambda x: self.bot.get_guild(m.guild).get_role(x).mention, data[d]))
             value += "\n"
-            await message.add_reaction(d)
         if not value:
             value = "No role yet..."
         embed.add_field(name=name, value=value)
-        await message.edit(embed=embed)
+
+        current = {str(r.emoji): r for r in message.reactions}
+        remove = [r.emoji for e, r in current.items() if e not in data]
+        add = [d for d in data if d not in current or not current[d].me]
+
+        async def sync_reactions():
+            for e in remove:
+                await message.clear_reaction(e)
+            for e in add:
+                await message.add_reaction(e)
+
+        calls = [sync_reactions()]
+        if embed.to_dict() != old:
+            calls.append(message.edit(embed=embed))
+        await gather(*calls)
+
+        saved = 2 + len(data) - len(remove) - len(add) - (len(calls) - 1)
+        logger.info(f"Updated role-reaction message {m.message}: {len(remove)} reaction(s) removed, "
+                    f"{len(add)} added, {saved} API call(s) saved")
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, message: RawMessageDeleteEvent):
-        s = db.Session()
-        r = s.query(db.RoRec).filter(db.RoRec.message == message.message_id).first()
-        if r:
-            s.delete(r)
-            s.commit()
-        s.close()
+        if message.message_id not in self.messages:
+            return
 
-    @commands.Cog.listener()
-    async def on_raw_bulk_message_delete(self, messages: RawBulkMessageDeleteEvent):
-        s = db.Session()
-        for id in messages.message_ids:
-            r = s.query(db.RoRec).filter(db.RoRec.message == id).first()
+        def delete(s):
+            r = s.query(db.RoRec).filter(db.RoRec.message == message.message_id).first()
             if r:
                 s.delete(r)
-        s.commit()
-        s.close()
+                s.commit()
+        await db.run(delete)
+        self.remove_messages(message.message_id)
 
     @commands.Cog.listener()
-    async def on_guild_channel_delete(self, channel: GuildChannel):
-        if isinstance(channel, TextChannel):
-            s = db.Session()
-            for r in s.query(db.RoRec).filter(db.RoRec.channel == channel.id).all():
+    async def on_raw_bulk_message_delete(self, messages: RawBulkMessageDeleteEvent):
+        if not messages.message_ids & self.messages.keys():
+            return
+
+        def delete(s) -> list:
+            rs = s.query(db.RoRec).filter(db.RoRec.message.in_(messages.message_ids)).all()
+            for r in rs:
                 s.delete(r)
             s.commit()
-            s.close()
+            return [r.message for r in rs]
+        self.remove_messages(*await db.run(delete))
 
     @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: RawReactionActionEvent):
-        s = db.Session()
-        if payload.guild_id and not event_is_enabled(self.qualified_name, payload.guild_id, s):
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        if isinstance(channel, TextChannel):
+            def delete(s) -> list:
+                rs = s.query(db.RoRec).filter(db.RoRec.channel == channel.id).all()
+                for r in rs:
+                    s.delete(r)
+                s.commit()
+                return [r.message for r in rs]
+            self.remove_messages(*await db.run(delete))
+
+    async def reaction_add(self, payload: RawReactionActionEvent):
+        if payload.guild_id and not event_is_enabled(self.qualified_name, payload.guild_id):
+            return
+        m = self.messages.get(payload.message_id)
+        if not m or payload.user_id == self.bot.user.id:
             return
-        m = s.query(db.RoRec).filter(db.RoRec.message == payload.message_id).first()
-        s.close()
-        if m and payload.member.id != self.bot.user.id:
-            data = m.get_data()
-            emoji = str(payload.emoji)
-            if emoji in data:
-                guild = self.bot.get_guild(payload.guild_id)
-                roles = [guild.get_role(r) for r in data[emoji]]
-                add = False
-
-                if m.one:
-                    del data[emoji]
-                    remove_roles = []
-                    [remove_roles.extend(map(lambda x: guild.get_role(x), data[e])) for e in data]
-                    await payload.member.remove_roles(*remove_roles, reason="Only one role-reaction message")
-
-                for r in filter(lambda x: x not in payload.member.roles, roles):
-                    try:
-                        await payload.member.add_roles(r, reason="Role-reaction message")
-                        add = True
-                    except Forbidden:
-                        await payload.member.send("I don't have the permission to add a role to you !")
-
-                if not add:
-                    try:
-                        await payload.member.remove_roles(*roles, reason="Role-reaction message")
-                    except Forbidden:
-                        await payload.member.send("I don't have the permission to remove one of your roles !")
-
-            await (await self.bot.get_channel(payload.channel_id).fetch_message(payload.message_id))\
-                .remove_reaction(payload.emoji, payload.member)
+
+        emoji = str(payload.emoji)
+        if emoji in m.data:
+            key = (payload.guild_id, payload.user_id)
+            lock = self.locks.get(key)
+            if not lock:
+                lock = self.locks[key] = Lock()
+            self.clicks[key] = self.clicks.get(key, 0) + 1
+            try:
+                async with lock:
+                    await self.toggle_roles(m, emoji, payload.member, key)
+            finally:
+                self.clicks[key] -= 1
+                if not self.clicks[key]:
+                    del self.clicks[key]
+                    del self.locks[key]
+
+        await remove_reaction(self.bot, payload.channel_id, payload.message_id, payload.emoji, payload.user_id)
+
+    async def toggle_roles(self, m: db.RoRec, emoji: str, member: Member, key: tuple):
+        guild = member.guild
+        roles = set(filter(None, map(guild.get_role, m.data[emoji])))
+        applied, date = self.applied.get(key, (None, 0))
+        if applied is not None and monotonic() - date < APPLIED_TIMEOUT:
+            current = set(filter(None, map(guild.get_role, applied)))
+        else:
+            current = set(member.roles[1:])
+        new = set(current)
+
+        if m.one:
+            for e, rs in m.data.items():
+                if e != emoji:
+                    new.difference_update(filter(None, map(guild.get_role, rs)))
+
+        if roles - current:
+            new |= roles
+        else:
+            new -= roles
+
+        if new != current:
+            try:
+                await member.edit(roles=list(new), reason="Role-reaction message")
+            except Forbidden:
+                await member.send("I don't have the permission to edit your roles !")
+            else:
+                self.applied[key] = ({r.id for r in new}, monotonic())
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: Member, after: Member):
+        key = (after.guild.id, after.id)
+        applied = self.applied.get(key)
+        if applied and (applied[0] == {r.id for r in after.roles[1:]} or monotonic() - applied[1] >= APPLIED_TIMEOUT):
+            del self.applied[key]
+
+    def cog_unload(self):
+        router.unregister(self.qualified_name)
 
 
 def setup(bot):
@@ -1,30 +1,51 @@
+from asyncio import CancelledError, sleep
+from copy import deepcopy
+from time import monotonic
+
 from discord.ext import commands
-from discord import Member, VoiceState, Embed, Reaction, Guild
+from discord import Member, VoiceState, Embed, Reaction
 from discord.ext.commands import BadArgument
 from discord_slash import SlashContext, cog_ext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
 
-from administrator import slash
+from administrator import slash, router
 from administrator.check import is_enabled, guild_only, has_permissions
+from administrator.config import config
 from administrator.logger import logger
-from administrator.utils import event_is_enabled
+from administrator.utils import event_is_enabled, edit_members
 
 extension_name = "speak"
 logger = logger.getChild(extension_name)
+CONCURRENCY = config.get("speak_concurrency", 10)
+RENDER_DELAY = config.get("speak_render_delay", 1)
 
 
-class Speak(commands.Cog):
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.strict = False
-        self.voice_chan = None
+class SpeakSession:
+    __slots__ = ("voice_chan", "strict", "waiting", "last_speaker", "reaction", "last_reaction", "voice_message",
+                 "last_message", "task", "embed", "rendered", "render")
+
+    def __init__(self, voice_chan: int, strict: bool = False):
+        self.voice_chan = voice_chan
+        self.strict = strict
         self.waiting = []
         self.last_speaker = None
         self.reaction = []
         self.last_reaction = None
         self.voice_message = None
         self.last_message = None
+        self.task = None
+        self.embed = None
+        self.rendered = None
+        self.render = None
+
+
+class Speak(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.sessions = {}
         slash.get_cog_commands(self)
+        router.register(self.qualified_name, "reaction_add", self.reaction_add)
+        router.register(self.qualified_name, "reaction_remove", self.reaction_remove)
 
     def description(self):
         return "Speech manager"
@@ -39,10 +60,14 @@ class Speak(commands.Cog):
     @guild_only()
     @has_permissions(mute_members=True)
     async def speak_setup(self, ctx: SlashContext, strict: bool = False):
-        self.strict = strict
         if not ctx.author.voice:
             raise BadArgument()
-        self.voice_chan = ctx.author.voice.channel.id
+        session = self.sessions.get(ctx.guild.id)
+        if session:
+            session.voice_chan = ctx.author.voice.channel.id
+            session.strict = strict
+        else:
+            session = self.sessions[ctx.guild.id] = SpeakSession(ctx.author.voice.channel.id, strict)
         embed = Embed(title="Speak \U0001f508")
         embed.add_field(name="Waiting list \u23f3", value="Nobody", inline=False)
         embed.add_field(name="Reactions",
@@ -55,10 +80,17 @@ class Speak(commands.Cog):
                               "\u274C Clear the speak\n"
                               "Remove your reaction to remove from list",
                         inline=False)
-        self.voice_message = await ctx.channel.send(embed=embed)
+        if session.voice_message:
+            router.untrack(session.voice_message.id)
+        if session.render:
+            session.render.cancel()
+            session.render = None
+        session.voice_message = await ctx.channel.send(embed=embed)
+        session.embed = embed
+        session.rendered = deepcopy(embed.to_dict())
+        router.track(self.qualified_name, session.voice_message.id)
         for reaction in ["\U0001f5e3", "\u2757", "\u27A1", "\U0001F512", "\U0001F507", "\U0001F50A", "\u274C"]:
-            await self.voice_message.add_reaction(reaction)
-        self.voice_message = await self.voice_message.channel.fetch_message(self.voice_message.id)
+            await session.voice_message.add_reaction(reaction)
 
     @cog_ext.cog_subcommand(base="speak", name="mute", description="Mute everyone on the speak channel except you")
     @is_enabled()
@@ -84,34 +116,36 @@ class Speak(commands.Cog):
     async def on_voice_state_update(self, member: Member, before: VoiceState, after: VoiceState):
         if member.guild and not event_is_enabled(self.qualified_name, member.guild.id):
             return
-        if self.voice_chan and self.strict and \
-                (before is None or before.channel is None or before.channel.id != self.voice_chan) and \
-                (after is not None and after.channel is not None and after.channel.id == self.voice_chan) and \
-                not (self.last_speaker and member.id == self.last_speaker) and \
-                not (self.reaction and member.id == self.last_reaction):
+        session = self.sessions.get(member.guild.id)
+        if not session:
+            return
+        if session.strict and \
+                (before is None or before.channel is None or before.channel.id != session.voice_chan) and \
+                (after is not None and after.channel is not None and after.channel.id == session.voice_chan) and \
+                not (session.last_speaker and member.id == session.last_speaker) and \
+                not (session.reaction and member.id == session.last_reaction):
             await member.edit(mute=True)
-        elif self.voice_chan and \
-                (before is not None and before.channel is not None and before.channel.id == self.voice_chan) and \
-                (after is not None and after.channel is not None and after.channel.id != self.voice_chan):
+        elif (before is not None and before.channel is not None and before.channel.id == session.voice_chan) and \
+                (after is not None and after.channel is not None and after.channel.id != session.voice_chan):
             await member.edit(mute=False)
 
     async def cog_after_invoke(self, ctx: SlashContext):
         await ctx.message.delete(delay=30)
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: Reaction, user: Member):
+    async def reaction_add(self, reaction: Reaction, user: Member):
         if isinstance(user, Member) and not event_is_enabled(self.qualified_name, user.guild.id):
             return
-        if not user.bot:
-            if self.voice_message and reaction.message.id == self.voice_message.id:
+        if not user.bot and reaction.message.guild:
+            session = self.sessions.get(reaction.message.guild.id)
+            if session and session.voice_message and reaction.message.id == session.voice_message.id:
                 if str(reaction.emoji) == "\U0001f5e3":
-                    await self.speak_action(reaction, user)
+                    await self.speak_action(session, reaction, user)
                 elif str(reaction.emoji) == "\u2757":
-                    await self.speak_react_action(reaction, user)
+                    await self.speak_react_action(session, reaction, user)
                 elif str(reaction.emoji) == "\u27A1":
-                    await self.speak_next_action(reaction, user)
+                    await self.speak_next_action(session, reaction, user)
                 elif str(reaction.emoji) in ["\U0001F512", "\U0001F513"]:
-                    await self.speak_strict_action(reaction, user)
+                    await self.speak_strict_action(session, reaction, user)
                 elif str(reaction.emoji) == "\U0001F507":
                     await self.mute(True, user)
                     await reaction.remove(user)
@@ -119,144 +153,202 @@ class Speak(commands.Cog):
                     await self.mute(False, user)
                     await reaction.remove(user)
                 elif str(reaction.emoji) == "\u274C":
-                    await self.speak_clear_action(reaction, user)
+                    await self.speak_clear_action(session, reaction, user)
                 else:
                     await reaction.remove(user)
-                await self.update_list(reaction.message.channel.guild)
+                self.update_list(session)
 
-    async def speak_action(self, reaction: Reaction, user: Member):
+    async def speak_action(self, session: SpeakSession, reaction: Reaction, user: Member):
         if user.voice is None or user.voice.channel is None or \
-                self.voice_chan is None or \
-                user.voice.channel.id != self.voice_chan or \
-                user.id in self.waiting:
+                session.voice_chan is None or \
+                user.voice.channel.id != session.voice_chan or \
+                user.id in session.waiting:
             await reaction.remove(user)
         else:
-            self.waiting.append(user.id)
+            session.waiting.append(user.id)
 
-    async def speak_react_action(self, reaction: Reaction, user: Member):
-        if user.voice is None or user.voice.channel is None or self.voice_chan is None or \
-                user.voice.channel.id != self.voice_chan or user.id in self.reaction or \
-                self.last_speaker is None or self.last_speaker == user.id:
+    async def speak_react_action(self, session: SpeakSession, reaction: Reaction, user: Member):
+        if user.voice is None or user.voice.channel is None or session.voice_chan is None or \
+                user.voice.channel.id != session.voice_chan or user.id in session.reaction or \
+                session.last_speaker is None or session.last_speaker == user.id:
             await reaction.remove(user)
         else:
-            self.reaction.append(user.id)
+            session.reaction.append(user.id)
 
-    async def speak_next_action(self, reaction: Reaction, user: Member):
+    async def speak_next_action(self, session: SpeakSession, reaction: Reaction, user: Member):
         await reaction.remove(user)
-        if self.voice_chan and \
-                reaction.message.guild.get_channel(self.voice_chan).permissions_for(user).mute_members:
-            if self.last_message:
-                await self.last_message.delete()
-            if self.last_reaction:
-                user: Member = reaction.message.guild.get_member(self.last_reaction)
-                self.reaction.remove(self.last_reaction)
-                if self.strict:
+        if session.voice_chan and \
+                reaction.message.guild.get_channel(session.voice_chan).permissions_for(user).mute_members:
+            if session.last_message:
+                await session.last_message.delete()
+            if session.last_reaction:
+                user: Member = reaction.message.guild.get_member(session.last_reaction)
+                session.reaction.remove(session.last_reaction)
+                if session.strict:
                     await user.edit(mute=True)
-                await self.voice_message.reactions[1].remove(user)
-            if self.last_speaker and len(self.reaction) == 0:
-                user: Member = reaction.message.guild.get_member(self.last_speaker)
-                self.waiting.remove(self.last_speaker)
-                if self.strict:
+                await session.voice_message.remove_reaction("\u2757", user)
+            if session.last_speaker and len(session.reaction) == 0:
+                user: Member = reaction.message.guild.get_member(session.last_speaker)
+                session.waiting.remove(session.last_speaker)
+                if session.strict:
                     await user.edit(mute=True)
-                await self.voice_message.reactions[0].remove(user)
-            if len(self.reaction) != 0 and self.last_speaker is not None:
-                user: Member = reaction.message.guild.get_member(self.reaction[0])
-                self.last_reaction = self.reaction[0]
-                self.last_message = await reaction.message.channel.send(
-                    f"{user.mention} react on {reaction.message.guild.get_member(self.last_speaker).mention} speak !")
-                if self.strict:
+                await session.voice_message.remove_reaction("\U0001f5e3", user)
+            if len(session.reaction) != 0 and session.last_speaker is not None:
+                user: Member = reaction.message.guild.get_member(session.reaction[0])
+                session.last_reaction = session.reaction[0]
+                session.last_message = await reaction.message.channel.send(
+                    f"{user.mention} react on "
+                    f"{reaction.message.guild.get_member(session.last_speaker).mention} speak !")
+                if session.strict:
                     await user.edit(mute=False)
-            elif len(self.waiting) != 0:
-                user: Member = reaction.message.guild.get_member(self.waiting[0])
-                self.last_speaker = self.waiting[0]
-                self.last_reaction = None
-                self.last_message = await reaction.message.channel.send(f"It's {user.mention} turn")
-                if self.strict:
+            elif len(session.waiting) != 0:
+                user: Member = reaction.message.guild.get_member(session.waiting[0])
+                session.last_speaker = session.waiting[0]
+                session.last_reaction = None
+                session.last_message = await reaction.message.channel.send(f"It's {user.mention} turn")
+                if session.strict:
                     await user.edit(mute=False)
             else:
-                self.last_speaker = None
-                self.last_reaction = None
-                self.last_message = await reaction.message.channel.send("Nobody left !")
+                session.last_speaker = None
+                session.last_reaction = None
+                session.last_message = await reaction.message.channel.send("Nobody left !")
 
-    async def speak_strict_action(self, reaction: Reaction, user: Member):
-        if not self.voice_chan or \
-                not reaction.message.guild.get_channel(self.voice_chan).permissions_for(user).mute_members:
+    async def speak_strict_action(self, session: SpeakSession, reaction: Reaction, user: Member):
+        if not session.voice_chan or \
+                not reaction.message.guild.get_channel(session.voice_chan).permissions_for(user).mute_members:
             await reaction.remove(user)
         else:
-            replace = ["\U0001F513", "\U0001F512"] if not self.strict else ["\U0001F512", "\U0001F513"]
-            self.strict = not self.strict
-            if self.strict:
-                for client in user.voice.channel.members:
-                    if client != user and not client.bot and \
-                            not (self.last_speaker and client.id == self.last_speaker) and \
-                            not (self.reaction and client.id == self.last_reaction):
-                        await client.edit(mute=True)
-            embed = self.voice_message.embeds[0]
-            field = embed.fields[1]
-            embed.remove_field(1)
-            embed.add_field(name=field.name, value=field.value.replace(replace[0], replace[1]), inline=False)
-            await self.voice_message.edit(embed=embed)
-            self.voice_message = await self.voice_message.channel.fetch_message(self.voice_message.id)
+            replace = ["\U0001F513", "\U0001F512"] if not session.strict else ["\U0001F512", "\U0001F513"]
+            session.strict = not session.strict
+            if session.strict:
+                await self.bulk_mute(session, [c for c in user.voice.channel.members if c != user and
+                                               not (session.last_speaker and c.id == session.last_speaker) and
+                                               not (session.reaction and c.id == session.last_reaction)], True)
+            field = session.embed.fields[1]
+            session.embed.set_field_at(1, name=field.name, value=field.value.replace(replace[0], replace[1]),
+                                       inline=False)
             await reaction.remove(user)
 
-    async def speak_clear_action(self, reaction: Reaction, user: Member):
-        speak_channel = reaction.message.guild.get_channel(self.voice_chan)
-        if not self.voice_chan or not speak_channel.permissions_for(user).mute_members:
+    async def speak_clear_action(self, session: SpeakSession, reaction: Reaction, user: Member):
+        speak_channel = reaction.message.guild.get_channel(session.voice_chan)
+        if not session.voice_chan or not speak_channel.permissions_for(user).mute_members:
             await reaction.remove(user)
         else:
-            self.waiting = []
-            self.last_speaker = None
-            self.reaction = []
-            self.last_reaction = None
-            for client in speak_channel.members:
-                if not client.bot:
-                    await client.edit(mute=False)
-            self.strict = False
-            self.voice_chan = None
-            if self.last_message:
-                await self.last_message.delete()
-                self.last_message = None
-            await self.voice_message.delete()
-            self.voice_message = None
+            session.waiting = []
+            session.last_speaker = None
+            session.reaction = []
+            session.last_reaction = None
+            if session.task:
+                session.task.cancel()
+            if session.render:
+                session.render.cancel()
+                session.render = None
+            await self.bulk_mute(None, speak_channel.members, False)
+            session.strict = False
+            session.voice_chan = None
+            if session.last_message:
+                await session.last_message.delete()
+                session.last_message = None
+            router.untrack(session.voice_message.id)
+            await session.voice_message.delete()
+            session.voice_message = None
+            self.sessions.pop(reaction.message.guild.id, None)
 
-    @commands.Cog.listener()
-    async def on_reaction_remove(self, reaction: Reaction, user: Member):
+    async def reaction_remove(self, reaction: Reaction, user: Member):
         if user.guild and not event_is_enabled(self.qualified_name, user.guild.id):
             return
-        if not user.bot:
-            if self.voice_message and reaction.message.id == self.voice_message.id:
-                if str(reaction.emoji) == "\U0001f5e3" and user.id in self.waiting and user.id != self.last_speaker:
-                    self.waiting.remove(user.id)
-                elif str(reaction.emoji) == "\u2757" and user.id in self.reaction and user.id != self.last_reaction:
-                    self.reaction.remove(user.id)
-                await self.update_list(reaction.message.channel.guild)
-
-    async def update_list(self, guild: Guild):
-        if self.voice_message:
-            persons = []
-            if len(self.reaction) != 0:
-                for i, reaction in enumerate(self.reaction):
-                    persons.append(f"Reaction N°{i+1}: {guild.get_member(reaction).display_name}")
-            for i, speaker in enumerate(self.waiting):
-                persons.append(f"N°{i+1}: {guild.get_member(speaker).display_name}")
-            if len(persons) == 0:
-                persons = "Nobody"
-            else:
-                persons = "\n".join(persons)
-            embed = self.voice_message.embeds[0]
-            field = embed.fields[0]
-            embed.remove_field(0)
-            embed.insert_field_at(0, name=field.name, value=persons, inline=True)
-            await self.voice_message.edit(embed=embed)
+        if not user.bot and reaction.message.guild:
+            session = self.sessions.get(reaction.message.guild.id)
+            if session and session.voice_message and reaction.message.id == session.voice_message.id:
+                if str(reaction.emoji) == "\U0001f5e3" and user.id in session.waiting and \
+                        user.id != session.last_speaker:
+                    session.waiting.remove(user.id)
+                elif str(reaction.emoji) == "\u2757" and user.id in session.reaction and \
+                        user.id != session.last_reaction:
+                    session.reaction.remove(user.id)
+                self.update_list(session)
+
+    def update_list(self, session: SpeakSession):
+        if session.voice_message and not session.render:
+            session.render = self.bot.loop.create_task(self.render_list(session))
+
+    async def render_list(self, session: SpeakSession):
+        await sleep(RENDER_DELAY)
+        session.render = None
+        if not session.voice_message:
+            return
+        guild = session.voice_message.guild
+        persons = []
+        if len(session.reaction) != 0:
+            for i, reaction in enumerate(session.reaction):
+                persons.append(f"Reaction N°{i+1}: {guild.get_member(reaction).display_name}")
+        for i, speaker in enumerate(session.waiting):
+            persons.append(f"N°{i+1}: {guild.get_member(speaker).display_name}")
+        if len(persons) == 0:
+            persons = "Nobody"
+        else:
+            persons = "\n".join(persons)
+        field = session.embed.fields[0]
+        session.embed.set_field_at(0, name=field.name, value=persons, inline=True)
+        # to_dict shares the fields list with the embed, so keep a copy of what was sent
+        rendered = deepcopy(session.embed.to_dict())
+        if rendered != session.rendered:
+            session.rendered = rendered
+            await session.voice_message.edit(embed=session.embed)
 
     async def mute(self, state: bool, user: Member) -> bool:
         if user.voice is None or user.voice.channel is None:
             return False
         else:
-            for client in user.voice.channel.members:
-                if not (client == user and state) and not client.bot:
-                    await client.edit(mute=state)
-            return True
+            session = self.sessions.get(user.guild.id)
+            if session and session.voice_chan != user.voice.channel.id:
+                session = None
+            return await self.bulk_mute(session, [c for c in user.voice.channel.members
+                                                  if not (c == user and state)], state)
+
+    async def bulk_mute(self, session: SpeakSession, members: list, state: bool) -> bool:
+        members = [m for m in members if not m.bot and m.voice and m.voice.mute != state]
+        if session and session.task:
+            session.task.cancel()
+        task = self.bot.loop.create_task(edit_members(members, self.mute_progress(session, state), CONCURRENCY,
+                                                      mute=state))
+        if session:
+            session.task = task
+        try:
+            await task
+        except CancelledError:
+            return False
+        finally:
+            if session and session.task is task:
+                session.task = None
+        return True
+
+    def mute_progress(self, session: SpeakSession, state: bool):
+        if not session or not session.voice_message:
+            return None
+        last = monotonic()
+        shown = False
+
+        async def progress(done: int, total: int):
+            nonlocal last, shown
+            if done != total and monotonic() - last < 2 or done == total and not shown:
+                return
+            last = monotonic()
+            shown = True
+            if done == total:
+                session.embed.set_footer()
+            else:
+                session.embed.set_footer(text=f"{'Muting' if state else 'Unmuting'} {done}/{total}...")
+            self.update_list(session)
+        return progress
+
+    def cog_unload(self):
+        router.unregister(self.qualified_name)
+        for session in self.sessions.values():
+            if session.task:
+                session.task.cancel()
+            if session.render:
+                session.render.cancel()
 
 
 def setup(bot):
@@ -1,31 +1,119 @@
-from urllib.parse import urlencode
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from time import monotonic
 
+from discord import File, Embed
 from discord.ext import commands
+from discord.ext.commands import BadArgument
 from discord_slash import cog_ext, SlashContext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
+from matplotlib.mathtext import math_to_image
 
 from administrator import slash
 from administrator.check import is_enabled
+from administrator.config import config
 from administrator.logger import logger
+from administrator.utils import ACK_WITH_SOURCE
 
 
 extension_name = "TeX"
+logger = logger.getChild(extension_name)
+CACHE_DIR = config.get("tex_cache", "tex_cache")
+CACHE_SIZE = config.get("tex_cache_size", 50*1024*1024)
+
+
+def render(formula: str, path: str) -> int:
+    math_to_image(f"${formula}$", path, dpi=200, format="png")
+    return os.path.getsize(path)
 
 
 class TeX(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.polls = {}
+        self.executor = ProcessPoolExecutor(max_workers=config.get("tex_workers", 2))
+        self.cache = OrderedDict()
+        self.size = 0
+        self.renders = {}
+        self.hits = 0
+        self.misses = 0
+        self.render_time = 0
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for f in sorted(os.scandir(CACHE_DIR), key=lambda f: f.stat().st_mtime):
+            if f.is_file() and f.name.endswith(".png"):
+                self.cache[f.name[:-4]] = f.stat().st_size
+                self.size += f.stat().st_size
         slash.get_cog_commands(self)
 
     def description(self):
         return "Render TeX formula"
 
+    @staticmethod
+    def path(key: str) -> str:
+        return os.path.join(CACHE_DIR, f"{key}.png")
+
+    async def get_image(self, formula: str) -> str:
+        key = sha256(formula.encode()).hexdigest()
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            os.utime(self.path(key))
+            return key
+
+        if key not in self.renders:
+            self.renders[key] = self.bot.loop.create_task(self.render(formula, key))
+        return await self.renders[key]
+
+    async def render(self, formula: str, key: str) -> str:
+        self.misses += 1
+        start = monotonic()
+        try:
+            size = await self.bot.loop.run_in_executor(self.executor, render, formula, self.path(key))
+        except ValueError:
+            raise BadArgument()
+        finally:
+            del self.renders[key]
+        self.render_time += monotonic() - start
+
+        self.cache[key] = size
+        self.size += size
+        while self.size > CACHE_SIZE and len(self.cache) > 1:
+            old, old_size = self.cache.popitem(last=False)
+            self.size -= old_size
+            try:
+                os.remove(self.path(old))
+            except OSError:
+                pass
+        return key
+
     @cog_ext.cog_slash(name="tex", description="Render a TeX formula", options=[
         manage_commands.create_option("formula", "The TeX formula", SlashCommandOptionType.STRING, True)])
     @is_enabled()
     async def tex(self, ctx: SlashContext, formula: str):
-        await ctx.send(content=f"https://chart.apis.google.com/chart?cht=tx&chs=40&{urlencode({'chl': formula})}")
+        channel = self.bot.get_channel(ctx.channel) if isinstance(ctx.channel, int) else ctx.channel
+        if not channel:
+            raise BadArgument()
+        file = File(self.path(await self.get_image(formula)), "tex.png")
+        await ctx.send(ACK_WITH_SOURCE)
+        await channel.send(file=file)
+
+    @commands.group("tex", pass_context=True)
+    async def tex_group(self, ctx: commands.Context):
+        pass
+
+    @tex_group.group("stats", pass_context=True)
+    @commands.is_owner()
+    async def tex_stats(self, ctx: commands.Context):
+        embed = Embed(title="TeX renders")
+        embed.add_field(name="Cached", value=f"{len(self.cache)} ({round(self.size/1024/1024, 2)} MB)")
+        embed.add_field(name="Hit ratio", value=f"{round(100*self.hits/max(self.hits+self.misses, 1), 2)}%")
+        if self.render_time:
+            embed.add_field(name="Renders", value=f"{round(self.misses/self.render_time, 2)}/s")
+        await ctx.send(embed=embed)
+
+    def cog_unload(self):
+        self.bot.loop.run_in_executor(None, self.executor.shutdown)
 
 
 def setup(bot):
@@ -1,113 +1,202 @@
 import re
-from datetime import datetime
+from asyncio import Semaphore, TimeoutError, gather
+from datetime import datetime, timedelta
+from random import uniform
 from time import mktime
 
-from discord import Embed, Forbidden, HTTPException
+from aiohttp import ClientSession, ClientTimeout, ClientError
+from discord import Embed, Forbidden, HTTPException, NotFound
 from discord.ext import commands, tasks
 from discord.ext.commands import BadArgument
 from discord_slash import SlashContext, cog_ext, SlashCommandOptionType
 from discord_slash.utils import manage_commands
 from feedparser import parse
+from sqlalchemy import or_
 
 import db
 from administrator import slash
 from administrator.check import is_enabled
+from administrator.config import config
 from administrator.logger import logger
 
 
 extension_name = "tomuss"
 logger = logger.getChild(extension_name)
 url_re = re.compile(r"https://tomuss\.univ-lyon1\.fr/S/[0-9]{4}/[a-zA-Z]+/rss/.+")
+MIN_INTERVAL = config.get("tomuss_min_interval", 2*60)
+DEFAULT_INTERVAL = 5*60
+MAX_INTERVAL = config.get("tomuss_max_interval", 2*60*60)
 
 
 class Tomuss(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.session = None
+        self.semaphore = Semaphore(config.get("tomuss_concurrency", 20))
         self.tomuss_loop.start()
         slash.get_cog_commands(self)
 
     def description(self):
         return "PCP Univ Lyon 1"
 
+    async def fetch(self, t: db.Tomuss) -> tuple:
+        if not self.session:
+            self.session = ClientSession(timeout=ClientTimeout(total=30))
+
+        headers = {}
+        if t.etag:
+            headers["If-None-Match"] = t.etag
+        if t.modified:
+            headers["If-Modified-Since"] = t.modified
+
+        async with self.semaphore:
+            async with self.session.get(t.url, headers=headers) as r:
+                if r.status == 304:
+                    return None, None
+                r.raise_for_status()
+                body = await r.read()
+                validators = r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+        return (await self.bot.loop.run_in_executor(None, parse, body)).entries, validators
+
     @cog_ext.cog_subcommand(base="tomuss", name="set", description="Set your tomuss RSS feed", options=[
         manage_commands.create_option("url", "The RSS URL", SlashCommandOptionType.STRING, True)])
     async def tomuss_set(self, ctx: SlashContext, url: str):
         if not url_re.fullmatch(url):
             raise BadArgument()
-        entries = parse(url).entries
+        t = db.Tomuss(ctx.author.id, url, None)
+        try:
+            entries, _ = await self.fetch(t)
+        except (ClientError, TimeoutError):
+            raise BadArgument()
 
         if not entries:
             raise BadArgument()
-        last = datetime.fromtimestamp(mktime(sorted(entries, key=lambda e: e.published_parsed)[0].published_parsed))
-
-        s = db.Session()
-        t = s.query(db.Tomuss).get(ctx.author.id)
-        if t:
-            t.url = url
-            t.last = last
-        else:
-            t = db.Tomuss(ctx.author.id, url, last)
-        s.add(t)
-        s.commit()
-        s.close()
+        t.last = datetime.fromtimestamp(mktime(sorted(entries, key=lambda e: e.published_parsed)[0].published_parsed))
+        t.poll_interval = DEFAULT_INTERVAL
+        t.failures = 0
+        t.next_poll = datetime.now() + timedelta(seconds=DEFAULT_INTERVAL)
+        t.etag = None
+        t.modified = None
+
+        def set_feed(s):
+            s.merge(t)
+            s.commit()
+        await db.run(set_feed)
 
         await ctx.channel.send(f"Tomuss RSS set for {ctx.author.mention} \U0001f44d")
 
     @cog_ext.cog_subcommand(base="tomuss", name="unset", description="Unset your tomuss RSS feed")
     async def tomuss_unset(self, ctx: SlashContext):
-        s = db.Session()
-        t = s.query(db.Tomuss).get(ctx.author.id)
-        if not t:
-            raise BadArgument()
-        s.delete(t)
-        s.commit()
-        s.close()
+        def unset_feed(s):
+            t = s.query(db.Tomuss).get(ctx.author.id)
+            if not t:
+                raise BadArgument()
+            s.delete(t)
+            s.commit()
+        await db.run(unset_feed)
         await ctx.send(content="\U0001f44d")
 
-    @tasks.loop(minutes=5)
+    @staticmethod
+    def reschedule(t: db.Tomuss, changed: bool = False, error: bool = False):
+        interval = t.poll_interval or DEFAULT_INTERVAL
+        if error:
+            t.failures = (t.failures or 0) + 1
+            delay = min(MAX_INTERVAL, interval * 2**t.failures)
+        else:
+            t.failures = 0
+            if changed:
+                t.poll_interval = max(MIN_INTERVAL, interval // 2)
+            else:
+                t.poll_interval = min(MAX_INTERVAL, int(interval * 1.5))
+            delay = t.poll_interval
+        t.next_poll = datetime.now() + timedelta(seconds=delay * uniform(0.9, 1.1))
+
+    @tasks.loop(seconds=30)
     async def tomuss_loop(self):
-        s = db.Session()
-
-        for t in s.query(db.Tomuss).all():
-            u = await self.bot.fetch_user(t.user_id)
+        def due(s) -> list:
+            now = datetime.now()
+            feeds = []
+            for t in s.query(db.Tomuss).filter(or_(db.Tomuss.next_poll <= now, db.Tomuss.next_poll.is_(None))):
+                if t.next_poll:
+                    feeds.append(t)
+                else:
+                    t.next_poll = now + timedelta(seconds=uniform(0, DEFAULT_INTERVAL))
+            s.commit()
+            return feeds
+
+        feeds = await db.run(due)
+        for t, r in zip(feeds, await gather(*[self.tomuss_check(t) for t in feeds], return_exceptions=True)):
+            if isinstance(r, Exception):
+                logger.error(f"Fail to check the feed of {t.user_id}: {r}")
+
+    @tomuss_loop.before_loop
+    async def before_tomuss_loop(self):
+        await self.bot.wait_until_ready()
+
+    async def tomuss_check(self, t: db.Tomuss):
+        def delete(s):
+            s.query(db.Tomuss).filter(db.Tomuss.user_id == t.user_id, db.Tomuss.url == t.url).delete()
+            s.commit()
+
+        def save(s):
+            s.query(db.Tomuss).filter(db.Tomuss.user_id == t.user_id, db.Tomuss.url == t.url).update({
+                db.Tomuss.last: t.last, db.Tomuss.etag: t.etag, db.Tomuss.modified: t.modified,
+                db.Tomuss.next_poll: t.next_poll, db.Tomuss.poll_interval: t.poll_interval,
+                db.Tomuss.failures: t.failures}, synchronize_session=False)
+            s.commit()
+
+        try:
+            if await self.check_feed(t):
+                await db.run(delete)
+                return
+            await db.run(save)
+        except Exception as e:
+            logger.warning(f"Fail to check the feed of {t.user_id}: {e}")
+            self.reschedule(t, error=True)
+            await db.run(save)
+
+    async def check_feed(self, t: db.Tomuss) -> bool:
+        entries, validators = await self.fetch(t)
+        last = t.last.utctimetuple()
+        entries = list(filter(lambda e: e.published_parsed > last,
+                              sorted(entries or [], key=lambda e: e.published_parsed)))
+        if entries:
+            u = self.bot.get_user(t.user_id)
             if not u:
-                s.delete(t)
-                s.commit()
-                continue
-
-            last = t.last.utctimetuple()
-            entries = list(filter(lambda e: e.published_parsed > last,
-                                  sorted(parse(t.url).entries, key=lambda e: e.published_parsed)))
-            if entries:
-                embed = Embed(title="Tomuss update !")
-                for e in entries:
-                    if len(e.title) > 256:
-                        title = e.title[:253] + "..."
-                    else:
-                        title = e.title
-
-                    summary = e.summary.replace("<br />", "\n").replace("<b>", "**").replace("</b>", "**")
-                    if len(summary) > 1024:
-                        summary = summary[:1021] + "..."
-
-                    embed.add_field(name=title, value=summary)
                 try:
-                    await u.send(embed=embed)
-                except Forbidden:
-                    s.delete(t)
-                    s.commit()
-                    continue
-                except HTTPException:
-                    await u.send("Too much to send, I can't handle it sorry...")
-                finally:
-                    t.last = datetime.fromtimestamp(mktime(entries[-1].published_parsed))
-                    s.add(t)
-                    s.commit()
-
-        s.close()
+                    u = await self.bot.fetch_user(t.user_id)
+                except NotFound:
+                    return True
+
+            embed = Embed(title="Tomuss update !")
+            for e in entries:
+                if len(e.title) > 256:
+                    title = e.title[:253] + "..."
+                else:
+                    title = e.title
+
+                summary = e.summary.replace("<br />", "\n").replace("<b>", "**").replace("</b>", "**")
+                if len(summary) > 1024:
+                    summary = summary[:1021] + "..."
+
+                embed.add_field(name=title, value=summary)
+            try:
+                await u.send(embed=embed)
+            except Forbidden:
+                return True
+            except HTTPException:
+                await u.send("Too much to send, I can't handle it sorry...")
+            t.last = datetime.fromtimestamp(mktime(entries[-1].published_parsed))
+        if validators:
+            t.etag, t.modified = validators
+        self.reschedule(t, changed=bool(entries))
+        return False
 
     def cog_unload(self):
         self.tomuss_loop.stop()
+        if self.session:
+            self.bot.loop.create_task(self.session.close())
 
 
 def setup(bot):
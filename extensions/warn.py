@@ -1,31 +1,79 @@
-from discord import Embed, Forbidden, Member, Guild
+from asyncio import Event
+from datetime import datetime, timedelta
+from functools import partial
+
+from discord import Embed, Forbidden, Member, Guild, RawReactionActionEvent, Object, Role, HTTPException, NotFound
 from discord.ext import commands
 from discord.ext.commands import BadArgument
 from discord_slash import cog_ext, SlashCommandOptionType, SlashContext
 from discord_slash.utils import manage_commands
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
 
-from administrator import db, slash
+from administrator import db, slash, router
 from administrator.check import is_enabled, guild_only, has_permissions
+from administrator.config import config
 from administrator.logger import logger
-from administrator.utils import time_pars, seconds_to_time_string
+from administrator.scheduler import Scheduler
+from administrator.utils import time_pars, seconds_to_time_string, event_is_enabled, remove_reaction, run_limited, \
+    ACK_WITH_SOURCE
 
 extension_name = "warn"
 logger = logger.getChild(extension_name)
+PAGE_SIZE = 10
+PAGE_TIMEOUT = 5*60
+SANCTION_BATCH = config.get("sanction_batch", 500)
+SANCTION_CONCURRENCY = config.get("sanction_concurrency", 10)
+SANCTION_RETRY = config.get("sanction_retry", 60)
+SANCTION_RETRIES = config.get("sanction_retries", 5)
+
+
+class WarnPages:
+    __slots__ = ("guild", "user", "author", "keys", "next")
+
+    def __init__(self, guild: int, user: int, author: int, next_key: tuple):
+        self.guild = guild
+        self.user = user
+        self.author = author
+        self.keys = [None]
+        self.next = next_key
 
 
 class Warn(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.pages = {}
+        self.scheduler = Scheduler(self.sanction_due)
+        self.loaded = None
+        self.exhausted = False
+        self.due = []
+        self.retries = {}
+        self.wakeup = Event()
         slash.get_cog_commands(self)
+        router.register(self.qualified_name, "raw_reaction_add", self.reaction_add)
+        self.scheduler.start(self.bot.loop)
+        self.sanctions_task = self.bot.loop.create_task(self.sanctions_loop())
 
     def description(self):
         return "Send warning to user and make custom action after a number of warn"
 
     @staticmethod
-    async def check_warn(ctx: SlashContext, target: Member):
-        s = db.Session()
-        c = s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == target.id).count()
-        a = s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id, db.WarnAction.count == c).first()
+    def count_warn(session: db.Session, guild: int, user: int, delta: int) -> int:
+        q = session.query(db.WarnCount).filter(db.WarnCount.guild == guild, db.WarnCount.user == user)
+        if not q.update({db.WarnCount.count: db.WarnCount.count + delta}, synchronize_session=False):
+            try:
+                with session.begin_nested():
+                    session.add(db.WarnCount(guild, user, max(delta, 0)))
+            except IntegrityError:
+                # A concurrent first warn inserted the counter since our update
+                q.update({db.WarnCount.count: db.WarnCount.count + delta}, synchronize_session=False)
+        c = session.query(db.WarnCount.count).filter(db.WarnCount.guild == guild, db.WarnCount.user == user).scalar()
+        session.commit()
+        return c
+
+    async def check_warn(self, ctx: SlashContext, target: Member, c: int):
+        a = await db.run(lambda s: s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id,
+                                                                 db.WarnAction.count == c).first())
         if a:
             reason = f"Action after {c} warns"
             if a.action == "kick":
@@ -33,7 +81,109 @@ class Warn(commands.Cog):
             elif a.action == "ban":
                 await target.ban(reason=reason)
             elif a.action == "mute":
-                pass  # Integration with upcoming ban & mute extension
+                await target.add_roles(await self.get_muted_role(ctx.guild), reason=reason)
+            if a.action in ["ban", "mute"] and a.duration:
+                await self.add_sanction(db.Sanction(ctx.guild.id, target.id, a.action,
+                                                    datetime.now() + timedelta(seconds=a.duration)))
+
+    @staticmethod
+    async def get_muted_role(guild: Guild) -> Role:
+        role = next(filter(lambda r: r.name == "Muted", guild.roles), None)
+        if not role:
+            role = await guild.create_role(name="Muted", reason="Mute warn action")
+            await run_limited([partial(c.set_permissions, role, send_messages=False, add_reactions=False, speak=False,
+                                       reason="Mute warn action") for c in guild.channels],
+                              None, SANCTION_CONCURRENCY)
+        return role
+
+    async def add_sanction(self, sanction: db.Sanction):
+        def add(s):
+            s.add(sanction)
+            s.commit()
+        await db.run(add)
+        if self.exhausted or not self.loaded or (sanction.expires_at, sanction.id) <= self.loaded:
+            self.scheduler.push(sanction.id, sanction.expires_at)
+
+    async def load_sanctions(self):
+        def load(s) -> list:
+            q = s.query(db.Sanction.id, db.Sanction.expires_at)
+            if self.loaded:
+                q = q.filter(or_(db.Sanction.expires_at > self.loaded[0],
+                                 and_(db.Sanction.expires_at == self.loaded[0], db.Sanction.id > self.loaded[1])))
+            return q.order_by(db.Sanction.expires_at, db.Sanction.id).limit(SANCTION_BATCH).all()
+
+        sanctions = await db.run(load)
+        for i, expires_at in sanctions:
+            self.scheduler.push(i, expires_at)
+        if len(sanctions) < SANCTION_BATCH:
+            self.exhausted = True
+        else:
+            self.loaded = (sanctions[-1][1], sanctions[-1][0])
+
+    def sanction_due(self, sanction_id: int):
+        self.due.append(sanction_id)
+        self.wakeup.set()
+
+    async def sanctions_loop(self):
+        await self.bot.wait_until_ready()
+        await self.load_sanctions()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.due:
+                batch, self.due = self.due[:SANCTION_BATCH], self.due[SANCTION_BATCH:]
+                try:
+                    await self.expire_sanctions(batch)
+                except Exception as e:
+                    logger.error(f"Fail to expire {len(batch)} sanction(s): {e}")
+                    for i in batch:
+                        self.retry_sanction(i)
+            if not self.exhausted and all(i in self.retries for i in self.scheduler.entries):
+                try:
+                    await self.load_sanctions()
+                except Exception as e:
+                    logger.error(f"Fail to load sanctions: {e}")
+
+    async def expire_sanctions(self, batch: list):
+        sanctions = await db.run(lambda s: s.query(db.Sanction).filter(db.Sanction.id.in_(batch)).all())
+        results = await run_limited([partial(self.expire_sanction, x) for x in sanctions], None,
+                                    SANCTION_CONCURRENCY)
+        expired = []
+        for sanction, result in zip(sanctions, results):
+            failed = isinstance(result, HTTPException) and not isinstance(result, NotFound)
+            if failed and not isinstance(result, Forbidden) and self.retries.get(sanction.id, 0) < SANCTION_RETRIES:
+                logger.warning(f"Fail to expire sanction {sanction.id}: {result}")
+                self.retry_sanction(sanction.id)
+                continue
+            if failed:
+                logger.error(f"Give up {sanction.action} sanction {sanction.id} of {sanction.user} "
+                             f"on {sanction.guild}: {result}")
+            expired.append(sanction.id)
+            self.retries.pop(sanction.id, None)
+
+        def delete(s):
+            s.query(db.Sanction).filter(db.Sanction.id.in_(expired)).delete(synchronize_session=False)
+            s.commit()
+        if expired:
+            await db.run(delete)
+
+    def retry_sanction(self, sanction_id: int):
+        retries = self.retries[sanction_id] = self.retries.get(sanction_id, 0) + 1
+        delay = min(SANCTION_RETRY * 2 ** (retries - 1), 3600)
+        self.scheduler.push(sanction_id, datetime.now() + timedelta(seconds=delay))
+
+    async def expire_sanction(self, sanction: db.Sanction):
+        guild = self.bot.get_guild(sanction.guild)
+        if not guild:
+            return
+        reason = "Sanction expired"
+        if sanction.action == "ban":
+            await guild.unban(Object(sanction.user), reason=reason)
+        elif sanction.action == "mute":
+            member = guild.get_member(sanction.user)
+            role = next(filter(lambda r: r.name == "Muted", guild.roles), None)
+            if member and role:
+                await member.remove_roles(role, reason=reason)
 
     @cog_ext.cog_subcommand(base="warn", name="add", description="Send a warn to a user", options=[
         manage_commands.create_option("user", "The user", SlashCommandOptionType.USER, True),
@@ -43,10 +193,10 @@ class Warn(commands.Cog):
     @guild_only()
     @has_permissions(kick_members=True, ban_members=True, mute_members=True)
     async def warn_add(self, ctx: SlashContext, user: Member, description: str):
-        s = db.Session()
-        s.add(db.Warn(user.id, ctx.author.id, ctx.guild.id, description))
-        s.commit()
-        s.close()
+        def add(s) -> int:
+            s.add(db.Warn(user.id, ctx.author.id, ctx.guild.id, description))
+            return self.count_warn(s, ctx.guild.id, user.id, 1)
+        c = await db.run(add)
 
         try:
             embed = Embed(title="You get warned !", description="A moderator send you a warn", color=0xff0000)
@@ -56,7 +206,7 @@ class Warn(commands.Cog):
             await ctx.send(content="Fail to send warn notification to the user, DM close :warning:")
         else:
             await ctx.send(content="\U0001f44d")
-        await self.check_warn(ctx, user)
+        await self.check_warn(ctx, user, c)
 
     @cog_ext.cog_subcommand(base="warn", name="remove", description="Remove a number of warn to a user", options=[
         manage_commands.create_option("user", "The user", SlashCommandOptionType.USER, True),
@@ -66,13 +216,16 @@ class Warn(commands.Cog):
     @guild_only()
     @has_permissions(kick_members=True, ban_members=True, mute_members=True)
     async def warn_remove(self, ctx: SlashContext, user: Member, number: int):
-        s = db.Session()
-        ws = s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == user.id).all()
-        if number <= 0 or number > len(ws):
-            raise BadArgument()
-        s.delete(ws[number-1])
-        s.commit()
-        s.close()
+        def remove(s):
+            if number <= 0:
+                raise BadArgument()
+            w = s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == user.id)\
+                .order_by(db.Warn.id).offset(number-1).first()
+            if not w:
+                raise BadArgument()
+            s.delete(w)
+            self.count_warn(s, ctx.guild.id, user.id, -1)
+        await db.run(remove)
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="warn", name="purge", description="Remove all warn of a user", options=[
@@ -81,11 +234,11 @@ class Warn(commands.Cog):
     @guild_only()
     @has_permissions(kick_members=True, ban_members=True, mute_members=True)
     async def warn_purge(self, ctx: SlashContext, user: Member):
-        s = db.Session()
-        for w in s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == user.id).all():
-            s.delete(w)
-        s.commit()
-        s.close()
+        def purge(s):
+            s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == user.id).delete()
+            s.query(db.WarnCount).filter(db.WarnCount.guild == ctx.guild.id, db.WarnCount.user == user.id).delete()
+            s.commit()
+        await db.run(purge)
         await ctx.send(content="\U0001f44d")
 
     @cog_ext.cog_subcommand(base="warn", name="list", description="List warn of the guild or a specified user",
@@ -96,39 +249,73 @@ class Warn(commands.Cog):
     @guild_only()
     @has_permissions(kick_members=True, ban_members=True, mute_members=True)
     async def warn_list(self, ctx: SlashContext, user: Member = None):
-        s = db.Session()
+        await ctx.send(ACK_WITH_SOURCE)
+        embed, next_key = await self.warn_page(ctx.guild.id, user.id if user else None, None)
+        embed.set_footer(text="Page 1")
+        message = await ctx.channel.send(embed=embed)
+        if next_key:
+            self.pages[message.id] = WarnPages(ctx.guild.id, user.id if user else None, ctx.author.id, next_key)
+            router.track(self.qualified_name, message.id)
+            await message.add_reaction("\u25c0")
+            await message.add_reaction("\u25b6")
+            self.bot.loop.call_later(PAGE_TIMEOUT, self.close_pages, message.id)
+
+    def close_pages(self, message_id: int):
+        self.pages.pop(message_id, None)
+        router.untrack(message_id)
+
+    async def warn_page(self, guild: int, user: int, after: tuple) -> tuple:
+        def page(s) -> list:
+            q = s.query(db.Warn).filter(db.Warn.guild == guild)
+            if user:
+                q = q.filter(db.Warn.user == user)
+            if after:
+                q = q.filter(or_(db.Warn.user > after[0], and_(db.Warn.user == after[0], db.Warn.id > after[1])))
+            return q.order_by(db.Warn.user, db.Warn.id).limit(PAGE_SIZE+1).all()
+        ws = await db.run(page)
+
         embed = Embed(title="Warn list")
-        ws = {}
-        if user:
-            ws[user.id] = s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id, db.Warn.user == user.id).all()
-        else:
-            for w in s.query(db.Warn).filter(db.Warn.guild == ctx.guild.id).all():
-                if w.user not in ws:
-                    ws[w.user] = []
-                ws[w.user].append(w)
-        s.close()
+        for w in ws[:PAGE_SIZE]:
+            description = w.description if len(w.description) <= 450 else w.description[:447] + "..."
+            embed.add_field(name=f"{self.bot.get_user(w.user) or w.user} - {w.date.strftime('%d/%m/%Y %H:%M')}",
+                            value=f"<@{w.author}>```{description}```", inline=False)
+        if not ws:
+            embed.description = "No warn"
+        next_key = (ws[PAGE_SIZE-1].user, ws[PAGE_SIZE-1].id) if len(ws) > PAGE_SIZE else None
+        return embed, next_key
 
-        for u in ws:
-            warns = [f"{self.bot.get_user(w.author).mention} - {w.date.strftime('%d/%m/%Y %H:%M')}```{w.description}```"
-                     for w in ws[u]]
-            embed.add_field(name=self.bot.get_user(u), value="\n".join(warns), inline=False)
+    async def reaction_add(self, payload: RawReactionActionEvent):
+        if payload.guild_id and not event_is_enabled(self.qualified_name, payload.guild_id):
+            return
+        p = self.pages.get(payload.message_id)
+        if not p or payload.user_id == self.bot.user.id:
+            return
+        await remove_reaction(self.bot, payload.channel_id, payload.message_id, payload.emoji, payload.user_id)
+        if payload.user_id != p.author:
+            return
 
-        await ctx.send(embeds=[embed])
+        if str(payload.emoji) == "\u25b6" and p.next:
+            p.keys.append(p.next)
+        elif str(payload.emoji) == "\u25c0" and len(p.keys) > 1:
+            p.keys.pop()
+        else:
+            return
+        embed, p.next = await self.warn_page(p.guild, p.user, p.keys[-1])
+        embed.set_footer(text=f"Page {len(p.keys)}")
+        await self.bot.http.edit_message(payload.channel_id, payload.message_id, embed=embed.to_dict())
 
     @cog_ext.cog_subcommand(base="warn", name="actions", description="List all the actions of the guild")
     @is_enabled()
     @guild_only()
     @has_permissions(kick_members=True, ban_members=True, mute_members=True)
     async def warn_actions(self, ctx: SlashContext):
-        s = db.Session()
         embed = Embed(title="Warn list")
         ws = {}
         embed.title = "Actions list"
-        for a in s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id).order_by(db.WarnAction.count) \
-                .all():
+        for a in await db.run(lambda s: s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id)
+                              .order_by(db.WarnAction.count).all()):
             action = f"{a.action} for {seconds_to_time_string(a.duration)}" if a.duration else a.action
             embed.add_field(name=f"{a.count} warn(s)", value=action, inline=False)
-        s.close()
 
         for u in ws:
             warns = [f"{self.bot.get_user(w.author).mention} - {w.date.strftime('%d/%m/%Y %H:%M')}```{w.description}```"
@@ -156,36 +343,43 @@ class Warn(commands.Cog):
                 (action not in ["kick", "nothing"] and not action.startswith("mute") and not action.startswith("ban")):
             raise BadArgument()
 
-        s = db.Session()
-        a = s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id, db.WarnAction.count == count).first()
+        if time:
+            time = time_pars(time).total_seconds()
 
-        if action == "nothing":
-            if a:
-                s.delete(a)
-            else:
-                raise BadArgument()
-        else:
-            if time:
-                time = time_pars(time).total_seconds()
-            if a:
-                a.action = action
-                a.duration = time
+        def set_action(s):
+            a = s.query(db.WarnAction).filter(db.WarnAction.guild == ctx.guild.id,
+                                              db.WarnAction.count == count).first()
+            if action == "nothing":
+                if a:
+                    s.delete(a)
+                else:
+                    raise BadArgument()
             else:
-                s.add(db.WarnAction(ctx.guild.id, count, action, time))
-
-        s.commit()
-        s.close()
+                if a:
+                    a.action = action
+                    a.duration = time
+                else:
+                    s.add(db.WarnAction(ctx.guild.id, count, action, time))
+            s.commit()
+        await db.run(set_action)
         await ctx.send(content="\U0001f44d")
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: Guild):
-        s = db.Session()
-        for w in s.query(db.Warn).filter(db.Warn.guild == guild.id).all():
-            s.delete(w)
-        for a in s.query(db.WarnAction).filter(db.WarnAction.guild == guild.id).all():
-            s.delete(a)
-        s.commit()
-        s.close()
+        def delete(s):
+            for w in s.query(db.Warn).filter(db.Warn.guild == guild.id).all():
+                s.delete(w)
+            s.query(db.WarnCount).filter(db.WarnCount.guild == guild.id).delete()
+            s.query(db.Sanction).filter(db.Sanction.guild == guild.id).delete()
+            for a in s.query(db.WarnAction).filter(db.WarnAction.guild == guild.id).all():
+                s.delete(a)
+            s.commit()
+        await db.run(delete)
+
+    def cog_unload(self):
+        router.unregister(self.qualified_name)
+        self.scheduler.stop()
+        self.sanctions_task.cancel()
 
 
 def setup(bot):
@@ -1 +1,9 @@
-import administrator
+from administrator import bot
+from administrator.config import config
+from db import migrations
+
+migrations.upgrade()
+
+import extensions
+
+bot.run(config.get("token"))
@@ -0,0 +1,27 @@
+from argparse import ArgumentParser
+
+import db
+from db import migrations
+
+parser = ArgumentParser(description="Manage the database schema")
+commands = parser.add_subparsers(dest="command", required=True)
+upgrade = commands.add_parser("upgrade", help="Upgrade the database to the latest or given version")
+upgrade.add_argument("version", type=int, nargs="?")
+commands.add_parser("current", help="Show the database version")
+commands.add_parser("history", help="List all the migrations")
+stamp = commands.add_parser("stamp", help="Mark the database as being at the given version without migrating")
+stamp.add_argument("version", type=int)
+args = parser.parse_args()
+
+if args.command == "upgrade":
+    migrations.upgrade(args.version)
+elif args.command == "current":
+    with db.engine.connect() as connection:
+        version = migrations.current(connection)
+    print(f"{version if version is not None else 'None'} (head: {migrations.head()})")
+elif args.command == "history":
+    for v, m in migrations.get_migrations():
+        print(f"{v}: {m.description}")
+elif args.command == "stamp":
+    with db.engine.begin() as connection:
+        migrations.stamp(connection, args.version)
@@ -0,0 +1,102 @@
+CREATE TABLE tasks (
+	id INTEGER NOT NULL,
+	message VARCHAR NOT NULL,
+	user BIGINT NOT NULL,
+	channel BIGINT NOT NULL,
+	date DATETIME NOT NULL,
+	creation_date DATETIME NOT NULL,
+	PRIMARY KEY (id)
+);
+CREATE TABLE greetings (
+	id INTEGER NOT NULL,
+	join_message TEXT NOT NULL,
+	join_enable BOOLEAN NOT NULL,
+	leave_message TEXT NOT NULL,
+	leave_enable BOOLEAN NOT NULL,
+	guild BIGINT NOT NULL,
+	PRIMARY KEY (id),
+	CHECK (join_enable IN (0, 1)),
+	CHECK (leave_enable IN (0, 1)),
+	UNIQUE (guild)
+);
+CREATE TABLE presentations (
+	id INTEGER NOT NULL,
+	channel BIGINT NOT NULL,
+	role BIGINT NOT NULL,
+	guild BIGINT NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (guild)
+);
+CREATE TABLE rorec (
+	id INTEGER NOT NULL,
+	message BIGINT NOT NULL,
+	"False" BIGINT,
+	guild BIGINT NOT NULL,
+	one BOOLEAN NOT NULL,
+	data TEXT NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (message),
+	CHECK (one IN (0, 1))
+);
+CREATE TABLE polls (
+	id INTEGER NOT NULL,
+	message BIGINT NOT NULL,
+	channel BIGINT NOT NULL,
+	guild BIGINT NOT NULL,
+	author BIGINT NOT NULL,
+	reactions VARCHAR NOT NULL,
+	multi BOOLEAN NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (message),
+	CHECK (multi IN (0, 1))
+);
+CREATE TABLE warns (
+	id INTEGER NOT NULL,
+	user BIGINT NOT NULL,
+	author BIGINT NOT NULL,
+	guild BIGINT NOT NULL,
+	description TEXT NOT NULL,
+	date DATETIME NOT NULL,
+	PRIMARY KEY (id)
+);
+CREATE TABLE warn_actions (
+	id INTEGER NOT NULL,
+	guild BIGINT NOT NULL,
+	count INTEGER NOT NULL,
+	action VARCHAR NOT NULL,
+	duration BIGINT,
+	PRIMARY KEY (id),
+	UNIQUE (count)
+);
+CREATE TABLE invite_role (
+	guild_id BIGINT NOT NULL,
+	invite_code VARCHAR NOT NULL,
+	role_id BIGINT NOT NULL,
+	PRIMARY KEY (guild_id, invite_code)
+);
+CREATE TABLE tomuss (
+	user_id BIGINT NOT NULL,
+	url VARCHAR NOT NULL,
+	last DATETIME NOT NULL,
+	PRIMARY KEY (user_id)
+);
+CREATE TABLE pcp (
+	guild_id BIGINT NOT NULL,
+	roles_re VARCHAR NOT NULL,
+	start_role_re VARCHAR,
+	PRIMARY KEY (guild_id)
+);
+CREATE TABLE extension (
+	name VARCHAR NOT NULL,
+	default_state BOOLEAN NOT NULL,
+	PRIMARY KEY (name),
+	CHECK (default_state IN (0, 1))
+);
+CREATE TABLE extension_state (
+	extension_name VARCHAR NOT NULL,
+	guild_id BIGINT NOT NULL,
+	state BOOLEAN NOT NULL,
+	PRIMARY KEY (extension_name, guild_id),
+	FOREIGN KEY(extension_name) REFERENCES extension (name),
+	CHECK (state IN (0, 1))
+);
@@ -0,0 +1,79 @@
+"""Run QUERIES queries from concurrent coroutines while a ticker measures how late the event loop wakes it up.
+
+Compares `db.run` with the original synchronous `db.Session()` called inside the coroutines. Each query scans the warns
+of a guild with WARNS rows, then sleeps LATENCY seconds in its thread to stand for a Postgres round trip. Run with
+`python tests/bench_db.py [queries] [latency]`.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from time import monotonic, sleep
+
+import conftest  # noqa: F401
+import db
+from db import migrations
+
+QUERIES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+WARNS = 50000
+CONCURRENCY = 50
+TICK = 0.001
+
+
+def query(s) -> int:
+    sleep(LATENCY)
+    return s.query(db.Warn).filter(db.Warn.guild == 1, db.Warn.description.like("%9%")).count()
+
+
+def blocking(func):
+    s = db.Session()
+    try:
+        return func(s)
+    finally:
+        s.close()
+
+
+async def ticker(lags: list, done: asyncio.Event):
+    while not done.is_set():
+        start = monotonic()
+        await asyncio.sleep(TICK)
+        lags.append(monotonic() - start - TICK)
+
+
+async def measure(name: str, call):
+    queue = list(range(QUERIES))
+
+    async def worker():
+        while queue:
+            queue.pop()
+            await call()
+
+    lags, done = [], asyncio.Event()
+    tick = asyncio.get_event_loop().create_task(ticker(lags, done))
+    start = monotonic()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = monotonic() - start
+    done.set()
+    await tick
+    print(f"{name}: {QUERIES} queries in {elapsed:.2f}s, loop stalled {sum(lags):.2f}s in total, "
+          f"worst stall {max(lags)*1000:.1f}ms, {len(lags)} ticks")
+
+
+async def main():
+    migrations.upgrade()
+
+    def add(s):
+        now = datetime.now()
+        s.bulk_insert_mappings(db.Warn, [dict(user=i % 1000, author=1, guild=1, description=f"warn {i}", date=now)
+                                         for i in range(WARNS)])
+        s.commit()
+    await db.run(add)
+
+    async def synchronous():
+        blocking(query)
+
+    await measure("synchronous Session", synchronous)
+    await measure("db.run", lambda: db.run(query))
+
+
+asyncio.run(main())
@@ -0,0 +1,30 @@
+"""Time the decode of the poll reactions and rorec data that every reaction paid, with eval and with JSON.
+
+The original handlers ran `eval` on the stored repr for every reaction. The JSON columns are decoded once when the
+row is loaded, so a reaction only looks the emoji up in the cached value. Run with `python tests/bench_decode.py`.
+"""
+import json
+from timeit import timeit
+
+from conftest import load_extension
+
+poll = load_extension("poll")
+RUNS = 100000
+
+POLL = poll.REACTIONS + ["\U0001F5D1"]
+ROREC = {chr(0x1F600 + i): [800000000000000000 + i*10 + r for r in range(3)] for i in range(20)}
+EMOJI = chr(0x1F600 + 19)
+
+
+def main():
+    for name, value, lookup in (("poll reactions", POLL, lambda v: EMOJI in v),
+                                ("rorec data", ROREC, lambda v: v.get(EMOJI))):
+        stored_repr, stored_json = str(value), json.dumps(value)
+        print(f"{name} ({len(stored_repr)} characters):")
+        for label, f in (("eval per reaction", lambda: lookup(eval(stored_repr))),
+                         ("json.loads per reaction", lambda: lookup(json.loads(stored_json))),
+                         ("cached JSON value", lambda: lookup(value))):
+            print(f"  {label}: {timeit(f, number=RUNS) / RUNS * 1e6:.2f}us")
+
+
+main()
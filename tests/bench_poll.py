@@ -0,0 +1,90 @@
+"""Run VOTERS votes, then change every vote, on a single-choice poll.
+
+Compares the REST calls of the vote map with the original handler, which fetched the message and paged through the
+users of every other reaction to find the previous vote. Run with `python tests/bench_poll.py [voters]`.
+"""
+import asyncio
+import sys
+from bisect import insort
+from time import monotonic
+from types import SimpleNamespace
+
+from conftest import load_extension
+import db
+from administrator.router import ReactionRouter
+from db import migrations
+
+poll = load_extension("poll")
+VOTERS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CHOICES = poll.REACTIONS[:4]
+
+
+class Http:
+    def __init__(self):
+        self.calls = 0
+
+    async def remove_reaction(self, *args):
+        self.calls += 1
+
+
+class Bot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self.user = SimpleNamespace(id=0)
+        self.http = Http()
+
+    def add_listener(self, listener):
+        pass
+
+
+def scan(reactions: dict, user: int, emoji: str) -> int:
+    calls = 1
+    for e, users in reactions.items():
+        if e == emoji:
+            continue
+        if user in users:
+            return calls + users.index(user) // 100 + 2
+        calls += max(1, -(-len(users) // 100))
+    return calls
+
+
+async def main():
+    migrations.upgrade()
+    p = db.Polls(1, 1, 1, 1, CHOICES + ["\U0001F5D1"])
+
+    def add(s):
+        s.add(p)
+        s.commit()
+    await db.run(add)
+
+    bot = Bot()
+    poll.router = ReactionRouter(bot)
+    cog = poll.Poll(bot)
+    while 1 not in cog.polls:
+        await asyncio.sleep(0.01)
+
+    votes = [(v, CHOICES[(v + r) % len(CHOICES)]) for r in range(2) for v in range(1, VOTERS + 1)]
+    start = monotonic()
+    for user, emoji in votes:
+        await cog.reaction_add(SimpleNamespace(message_id=1, channel_id=1, guild_id=None, user_id=user, emoji=emoji,
+                                               member=SimpleNamespace(id=user, bot=False)))
+    elapsed = monotonic() - start
+    while cog.flushing:
+        await asyncio.sleep(0.1)
+    stored = await db.run(lambda s: s.query(db.PollVote).count())
+    print(f"vote map: {len(votes)} votes in {elapsed:.2f}s ({len(votes)/elapsed:.0f}/s), "
+          f"{bot.http.calls} REST calls, {stored} votes stored")
+
+    reactions = {e: [] for e in CHOICES}
+    calls = 0
+    for user, emoji in votes:
+        calls += scan(reactions, user, emoji)
+        for users in reactions.values():
+            if user in users:
+                users.remove(user)
+        insort(reactions[emoji], user)
+    print(f"reaction scan: {len(votes)} votes, {calls} REST calls ({calls/len(votes):.1f} per vote)")
+    cog.cog_unload()
+
+
+asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Send MESSAGES messages over GUILDS guilds through Presentation.on_message, one in fifty in a presentation channel.
+
+Compares the in-memory map with the original handler, which read the extension state and the guild's presentation from
+the database for every message. Run with `python tests/bench_presentation.py [messages]`.
+"""
+import asyncio
+import sys
+from time import monotonic
+from types import SimpleNamespace
+
+from conftest import load_extension
+import db
+from db import migrations
+
+presentation = load_extension("presentation")
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+GUILDS = 100
+SAMPLE = 2000
+ROLE = SimpleNamespace(id=1)
+
+
+class Bot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+
+
+class Author:
+    roles = [ROLE]
+
+    async def add_roles(self, *roles, reason=None):
+        pass
+
+
+def message(i: int):
+    guild = i % GUILDS
+    channel = guild if i % 50 == 0 else GUILDS + i
+    return SimpleNamespace(guild=SimpleNamespace(id=guild), channel=SimpleNamespace(id=channel), author=Author())
+
+
+def original(s, m):
+    s.query(db.ExtensionState).get(("Presentation", m.guild.id))
+    p = s.query(db.Presentation).filter(db.Presentation.guild == m.guild.id).first()
+    return p and p.channel == m.channel.id and p.role not in map(lambda x: x.id, m.author.roles)
+
+
+async def main():
+    migrations.upgrade()
+
+    def add(s):
+        s.add(db.Extension("Presentation"))
+        for g in range(GUILDS):
+            s.add(db.Presentation(g, g, ROLE.id))
+            s.add(db.ExtensionState("Presentation", g))
+        s.commit()
+    await db.run(add)
+
+    cog = presentation.Presentation(Bot())
+    while len(cog.presentations) < GUILDS:
+        await asyncio.sleep(0.01)
+
+    start = monotonic()
+    for i in range(MESSAGES):
+        await cog.on_message(message(i))
+    elapsed = monotonic() - start
+    print(f"in-memory map: {MESSAGES} messages in {elapsed:.2f}s ({elapsed/MESSAGES*1e6:.2f}us per message, "
+          f"{MESSAGES/elapsed:.0f} messages/s), 0 queries")
+
+    s = db.Session()
+    try:
+        start = monotonic()
+        for i in range(SAMPLE):
+            original(s, message(i))
+        elapsed = monotonic() - start
+    finally:
+        s.close()
+    print(f"original handler: {SAMPLE} messages in {elapsed:.2f}s ({elapsed/SAMPLE*1e6:.2f}us per message, "
+          f"{SAMPLE/elapsed:.0f} messages/s), 2 queries per message")
+
+
+asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Send REACTIONS reactions through the router, one in a hundred on a tracked message.
+
+Compares the router with the original listeners, where Poll and RoRec each read the extension state and their table and
+Purge read the extension state and fetched the message, for every reaction. Run with
+`python tests/bench_router.py [reactions]`.
+"""
+import asyncio
+import sys
+from time import monotonic
+from types import SimpleNamespace
+
+import conftest  # noqa: F401
+import db
+from administrator.router import ReactionRouter
+from db import migrations
+
+REACTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+TRACKED = 1000
+SAMPLE = 2000
+
+
+class Bot:
+    def add_listener(self, listener):
+        pass
+
+
+def payload(i: int):
+    message = i % TRACKED if i % 100 == 0 else TRACKED + i
+    return SimpleNamespace(message_id=message, channel_id=1, guild_id=1, user_id=i, emoji="\U0001f44d")
+
+
+def original(s, p):
+    for cog, model in (("Poll", db.Polls), ("RoRec", db.RoRec)):
+        s.query(db.ExtensionState).get((cog, p.guild_id))
+        s.query(model).filter(model.message == p.message_id).first()
+    s.query(db.ExtensionState).get(("Purge", p.guild_id))
+
+
+async def main():
+    migrations.upgrade()
+    router = ReactionRouter(Bot())
+    calls = []
+
+    async def handle(payload):
+        calls.append(payload)
+    for cog in ("Poll", "RoRec"):
+        router.register(cog, "raw_reaction_add", handle)
+    for m in range(TRACKED):
+        router.track("Poll" if m % 2 else "RoRec", m)
+
+    start = monotonic()
+    for i in range(REACTIONS):
+        await router.on_raw_reaction_add(payload(i))
+    elapsed = monotonic() - start
+    print(f"router: {REACTIONS} reactions in {elapsed:.2f}s ({elapsed/REACTIONS*1e6:.2f}us per reaction), "
+          f"{len(calls)} handler calls, 0 queries, 0 REST calls")
+
+    s = db.Session()
+    try:
+        start = monotonic()
+        for i in range(SAMPLE):
+            original(s, payload(i))
+        elapsed = monotonic() - start
+    finally:
+        s.close()
+    print(f"original listeners: {SAMPLE} reactions in {elapsed:.2f}s ({elapsed/SAMPLE*1e6:.2f}us per reaction), "
+          f"5 queries and 1 REST call (Purge fetch_message) per reaction")
+
+
+asyncio.run(main())
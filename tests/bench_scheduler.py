@@ -0,0 +1,64 @@
+"""Schedule REMINDERS reminders due over the next SPREAD seconds and measure how late each one fires.
+
+Also times the startup load of the reminders from the database and the scan the original one-minute loop ran, which
+fired reminders up to 60 s late. Run with `python tests/bench_scheduler.py [reminders] [spread]`.
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from time import monotonic
+
+import conftest  # noqa: F401
+import db
+from administrator.scheduler import Scheduler
+from db import migrations
+
+REMINDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+SPREAD = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+
+async def main():
+    migrations.upgrade()
+    now = datetime.now()
+
+    def add(s):
+        s.bulk_insert_mappings(db.Task, [dict(message="test", user=1, channel=1, creation_date=now,
+                                              date=now + timedelta(days=1, seconds=i)) for i in range(REMINDERS)])
+        s.commit()
+    await db.run(add)
+
+    start = monotonic()
+    tasks = await db.run(lambda s: s.query(db.Task.id, db.Task.date, db.Task.channel).all())
+    loaded = Scheduler(lambda key: None)
+    for i, date, _ in tasks:
+        loaded.push(i, date)
+    print(f"startup load: {len(loaded)} reminders in {(monotonic() - start)*1000:.0f}ms")
+
+    start = monotonic()
+    for _ in range(10):
+        await db.run(lambda s: s.query(db.Task).filter(db.Task.date <= datetime.now()).all())
+    print(f"original scan: {(monotonic() - start)*100:.2f}ms per minute with nothing due")
+
+    dates = {}
+    lateness = []
+
+    def fired(key):
+        lateness.append((datetime.now() - dates[key]).total_seconds())
+    scheduler = Scheduler(fired)
+    scheduler.start(asyncio.get_event_loop())
+    start = monotonic()
+    first = datetime.now() + timedelta(seconds=1)
+    for i in range(REMINDERS):
+        dates[i] = first + timedelta(seconds=SPREAD * i / REMINDERS)
+        scheduler.push(i, dates[i])
+    print(f"push: {REMINDERS} reminders in {(monotonic() - start)*1000:.0f}ms")
+
+    while len(lateness) < REMINDERS:
+        await asyncio.sleep(0.1)
+    scheduler.stop()
+    lateness.sort()
+    print(f"fired: {len(lateness)} reminders, late by median {lateness[len(lateness)//2]*1000:.2f}ms, "
+          f"p99 {lateness[len(lateness)*99//100]*1000:.2f}ms, max {lateness[-1]*1000:.2f}ms")
+
+
+asyncio.run(main())
@@ -0,0 +1,62 @@
+"""Run SESSIONS Speak sessions, each with MEMBERS members queuing up and speaking in turn.
+
+Reports the event throughput when the sessions run one after the other and when they all run at once, and checks that
+no session saw another guild's members. Run with `python tests/bench_speak.py [sessions] [members]`.
+"""
+import asyncio
+import sys
+from time import monotonic
+from types import SimpleNamespace
+
+import conftest  # noqa: F401
+from test_speak import Guild, Member, make_cog, react, setup_session, SPEAK, NEXT
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+MEMBERS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+async def session(cog, guild: Guild) -> int:
+    message = await setup_session(cog, guild)
+    members = list(guild.members.values())
+    events = 0
+    for member in members:
+        await react(guild, message, SPEAK, member)
+        await asyncio.sleep(0)
+        events += 1
+    for _ in range(MEMBERS + 1):
+        await react(guild, message, NEXT, members[0])
+        await asyncio.sleep(0)
+        events += 1
+    joining = Member(guild, guild.voice)
+    await cog.on_voice_state_update(joining, SimpleNamespace(channel=None), joining.voice)
+    return events + 1
+
+
+async def run(concurrent: bool) -> tuple:
+    cog = make_cog()
+    guilds = [Guild(MEMBERS) for _ in range(SESSIONS)]
+    start = monotonic()
+    if concurrent:
+        events = sum(await asyncio.gather(*[session(cog, g) for g in guilds]))
+    else:
+        events = 0
+        for g in guilds:
+            events += await session(cog, g)
+    elapsed = monotonic() - start
+    await asyncio.sleep(0.05)
+    for g in guilds:
+        turns = [m.content for m in g.text.messages[1:]]
+        assert turns == [f"It's <@{m}> turn" for m in g.members] + ["Nobody left !"], "a session leaked"
+        assert g.text.messages[0].edits >= 1
+    cog.cog_unload()
+    return events, elapsed
+
+
+async def main():
+    for concurrent in (False, True):
+        events, elapsed = await run(concurrent)
+        print(f"{SESSIONS} sessions {'at once' if concurrent else 'one by one'}: {events} events in {elapsed:.2f}s "
+              f"({elapsed/events*1e6:.1f}us per event, {events/elapsed:.0f} events/s)")
+
+
+asyncio.run(main())
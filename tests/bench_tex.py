@@ -0,0 +1,50 @@
+"""Serve REQUESTS TeX requests drawn from a Zipf-like popularity over FORMULAS distinct formulas.
+
+Requests arrive in waves of WAVE concurrent requests, first on a cold cache, then again on the warm cache.
+Reports the renders/s of the process pool, the cache hit ratio and the overall request rate.
+Run with `python tests/bench_tex.py [requests] [formulas]`.
+"""
+import asyncio
+import sys
+from random import Random
+from tempfile import mkdtemp
+from time import monotonic
+
+from conftest import load_extension
+
+tex = load_extension("tex")
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+FORMULAS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+WAVE = 8
+
+
+class Bot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+
+
+async def serve(cog, requests: list, name: str):
+    hits, misses = cog.hits, cog.misses
+    start = monotonic()
+    for i in range(0, len(requests), WAVE):
+        await asyncio.gather(*[cog.get_image(f) for f in requests[i:i+WAVE]])
+    elapsed = monotonic() - start
+    hits, misses = cog.hits - hits, cog.misses - misses
+    print(f"{name}: {len(requests)} requests in {elapsed:.2f}s ({len(requests)/elapsed:.0f}/s), "
+          f"{misses} renders ({misses/elapsed:.1f}/s), hit ratio {100*hits/len(requests):.1f}%")
+
+
+async def main():
+    tex.CACHE_DIR = mkdtemp()
+    cog = tex.TeX(Bot())
+    formulas = [rf"\sum_{{i=0}}^{{{n}}} \frac{{x^i}}{{{n + 1}!}}" for n in range(FORMULAS)]
+    requests = Random(0).choices(formulas, weights=[1 / (n + 1) for n in range(FORMULAS)], k=REQUESTS)
+    try:
+        await serve(cog, requests, "cold")
+        await serve(cog, requests, "warm")
+    finally:
+        await cog.bot.loop.run_in_executor(None, cog.executor.shutdown)
+    print(f"cache: {len(cog.cache)} images, {cog.size/1024:.0f} KB, {tex.config.get('tex_workers', 2)} workers")
+
+
+asyncio.run(main())
@@ -0,0 +1,55 @@
+"""Fetch FEEDS Tomuss feeds twice from a local server: a cold pass, then a conditional (304) pass.
+
+Run with `python tests/bench_tomuss.py [feeds]`.
+"""
+import asyncio
+import sys
+from time import monotonic
+
+import conftest  # noqa: F401
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import db
+from test_tomuss import RSS, ITEM, tomuss
+
+FEEDS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+async def main():
+    body = RSS.format("".join(ITEM.format(f"UE{i}", f"Mon, 0{i} Feb 2021 10:00:00 GMT") for i in range(1, 10)))
+    statuses = []
+
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get("If-None-Match") == '"v1"':
+            statuses.append(304)
+            return web.Response(status=304)
+        statuses.append(200)
+        return web.Response(body=body, content_type="application/rss+xml", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/feed/{id}", handle)
+    server = TestServer(app)
+    await server.start_server()
+
+    cog = tomuss.Tomuss.__new__(tomuss.Tomuss)
+    cog.bot = type("Bot", (), {"loop": asyncio.get_event_loop()})
+    cog.session = None
+    cog.semaphore = asyncio.Semaphore(tomuss.config.get("tomuss_concurrency", 20))
+    feeds = [db.Tomuss(i, str(server.make_url(f"/feed/{i}")), None) for i in range(FEEDS)]
+    try:
+        for name in ["cold", "conditional"]:
+            statuses.clear()
+            start = monotonic()
+            for t, (entries, validators) in zip(feeds, await asyncio.gather(*[cog.fetch(t) for t in feeds])):
+                if validators:
+                    t.etag, t.modified = validators
+            elapsed = monotonic() - start
+            print(f"{name}: {FEEDS} feeds in {elapsed:.2f}s ({FEEDS/elapsed:.0f}/s), "
+                  f"{statuses.count(304)} not modified")
+    finally:
+        await cog.session.close()
+        await server.close()
+
+
+asyncio.run(main())
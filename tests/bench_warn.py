@@ -0,0 +1,70 @@
+"""List the warns of a guild with WARNS warns, page by page, then add warns.
+
+Compares the keyset pages with the original listing, which loaded every warn of the guild, and the counter table with
+the original `count()` over the warns of the user. Run with `python tests/bench_warn.py [warns]`.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from time import monotonic
+from types import SimpleNamespace
+
+from conftest import load_extension
+import db
+from db import migrations
+
+warn = load_extension("warn")
+WARNS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+USERS = 1000
+
+
+async def main():
+    migrations.upgrade()
+
+    def add(s):
+        now = datetime.now()
+        s.bulk_insert_mappings(db.Warn, [dict(user=i % USERS, author=1, guild=1, description=f"warn {i}", date=now)
+                                         for i in range(WARNS)])
+        s.bulk_insert_mappings(db.WarnCount, [dict(guild=1, user=u, count=WARNS // USERS) for u in range(USERS)])
+        s.commit()
+    await db.run(add)
+
+    cog = warn.Warn.__new__(warn.Warn)
+    cog.bot = SimpleNamespace(get_user=lambda i: None)
+
+    times, key = [], None
+    while True:
+        start = monotonic()
+        embed, key = await cog.warn_page(1, None, key)
+        times.append(monotonic() - start)
+        if not key:
+            break
+    print(f"keyset pages: {len(times)} pages, first {times[0]*1000:.2f}ms, last {times[-1]*1000:.2f}ms, "
+          f"max {max(times)*1000:.2f}ms")
+
+    def load_all(s) -> dict:
+        ws = {}
+        for w in s.query(db.Warn).filter(db.Warn.guild == 1).all():
+            ws.setdefault(w.user, []).append(w)
+        return ws
+    start = monotonic()
+    await db.run(load_all)
+    print(f"full listing: {WARNS} warns loaded in {(monotonic() - start)*1000:.2f}ms")
+
+    def count_warn(s) -> int:
+        s.add(db.Warn(0, 1, 1, "new"))
+        return warn.Warn.count_warn(s, 1, 0, 1)
+
+    def count(s) -> int:
+        s.add(db.Warn(0, 1, 1, "new"))
+        s.commit()
+        return s.query(db.Warn).filter(db.Warn.guild == 1, db.Warn.user == 0).count()
+
+    for name, f in (("counter", count_warn), ("count()", count)):
+        start = monotonic()
+        for _ in range(100):
+            await db.run(f)
+        print(f"{name}: 100 warns added in {(monotonic() - start)*1000:.2f}ms")
+
+
+asyncio.run(main())
@@ -0,0 +1,69 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+from os.path import abspath, dirname, exists, join
+from tempfile import mkdtemp
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+directory = mkdtemp()
+DB = join(directory, "test.db")
+with open(join(directory, "config.json"), "w") as f:
+    json.dump({"db": f"sqlite:///{DB}"}, f)
+
+cwd = os.getcwd()
+os.chdir(directory)
+try:
+    import db
+    import administrator
+finally:
+    os.chdir(cwd)
+
+# The slash command client schedules its command sync on the bot loop, which never runs here
+tasks = asyncio.all_tasks(administrator.bot.loop)
+for task in tasks:
+    task.cancel()
+administrator.bot.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+BASELINE = join(dirname(abspath(__file__)), "baseline_schema.sql")
+
+
+def load_extension(name: str):
+    """Load an extension module on its own, without the bot loading every other extension"""
+    spec = importlib.util.spec_from_file_location(name, join(ROOT, "extensions", f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    module.slash = SimpleNamespace(get_cog_commands=lambda c: None)
+    return module
+
+
+def reset():
+    db.engine.dispose()
+    if exists(DB):
+        os.remove(DB)
+
+
+@pytest.fixture
+def database():
+    reset()
+    yield db.engine
+    reset()
+
+
+@pytest.fixture
+def baseline(database):
+    connection = database.raw_connection()
+    try:
+        with open(BASELINE) as f:
+            connection.executescript(f.read())
+        connection.commit()
+    finally:
+        connection.close()
+    return database
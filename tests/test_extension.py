@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import db
+from administrator.utils import event_is_enabled, extension_states
+from conftest import load_extension
+from db import migrations
+
+extension = load_extension("extension")
+
+
+def add_states():
+    migrations.upgrade()
+    s = db.Session()
+    try:
+        s.add(db.Extension("Poll"))
+        s.add(db.ExtensionState("Poll", 1, False))
+        s.add(db.ExtensionState("Poll", 2))
+        s.commit()
+    finally:
+        s.close()
+
+
+def test_states_are_loaded_with_the_cog(database):
+    add_states()
+    extension_states.clear()
+    loop = asyncio.new_event_loop()
+    try:
+        extension.Extension(SimpleNamespace(loop=loop))
+        assert not event_is_enabled("Poll", 1)
+        assert event_is_enabled("Poll", 2)
+    finally:
+        loop.close()
+        extension_states.clear()
+
+
+def test_states_are_reloaded_on_reload(database):
+    add_states()
+    extension_states.clear()
+
+    async def main():
+        extension.Extension(SimpleNamespace(loop=asyncio.get_event_loop()))
+        assert extension_states == {}
+        await asyncio.sleep(0.1)
+        assert extension_states == {("Poll", 1): False, ("Poll", 2): True}
+    try:
+        asyncio.run(main())
+    finally:
+        extension_states.clear()
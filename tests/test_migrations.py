@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+import db
+from db import migrations
+
+
+def version(engine) -> int:
+    with engine.connect() as connection:
+        return migrations.current(connection)
+
+
+def test_migrations_are_numbered():
+    versions = [v for v, m in migrations.get_migrations()]
+    assert versions == list(range(1, migrations.head() + 1))
+    assert all(m.description for v, m in migrations.get_migrations())
+
+
+def test_upgrade_empty_database(database):
+    migrations.upgrade()
+    assert version(database) == migrations.head()
+    assert set(inspect(database).get_table_names()) == set(db.Base.metadata.tables)
+
+
+def test_upgrade_baseline(baseline):
+    now = datetime.now()
+    with baseline.begin() as connection:
+        connection.execute(text("INSERT INTO extension (name, default_state) VALUES ('warn', 1)"))
+        for user in [2, 2, 2, 3]:
+            connection.execute(text("INSERT INTO warns (user, author, guild, description, date) "
+                                    "VALUES (:user, 1, 1, 'test', :date)"), user=user, date=now)
+        connection.execute(text("INSERT INTO polls (message, channel, guild, author, reactions, multi) "
+                                "VALUES (1, 1, 1, 1, :reactions, 0)"), reactions=str(["a", "b"]))
+        connection.execute(text("INSERT INTO rorec (message, \"False\", guild, one, data) "
+                                "VALUES (1, 1, 1, 0, :data)"), data=str({"x": [1]}))
+        connection.execute(text("INSERT INTO tomuss (user_id, url, last) VALUES (1, 'url', :date)"), date=now)
+    assert version(baseline) is None
+
+    migrations.upgrade()
+    assert version(baseline) == migrations.head()
+
+    inspector = inspect(baseline)
+    for table in db.Base.metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        assert columns == {c.name for c in table.columns}, table.name
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        assert {i.name for i in table.indexes} <= indexes, table.name
+
+    s = db.Session()
+    try:
+        assert {(c.guild, c.user): c.count for c in s.query(db.WarnCount)} == {(1, 2): 3, (1, 3): 1}
+        poll = s.query(db.Polls).one()
+        assert poll.reactions == ["a", "b"]
+        assert poll.legacy
+        assert s.query(db.RoRec).one().data == {"x": [1]}
+        t = s.query(db.Tomuss).one()
+        assert t.etag is None and t.next_poll is None
+    finally:
+        s.close()
+
+
+def test_upgrade_to_target(baseline):
+    migrations.upgrade(3)
+    assert version(baseline) == 3
+    assert "poll_votes" not in inspect(baseline).get_table_names()
+
+    migrations.upgrade()
+    assert version(baseline) == migrations.head()
+    migrations.upgrade()
+    assert version(baseline) == migrations.head()
+
+
+def test_polls_before_vote_tracking_are_legacy(baseline):
+    from discord.utils import time_snowflake
+
+    def insert(connection, message: int):
+        connection.execute(text("INSERT INTO polls (message, channel, guild, author, reactions, multi) "
+                                "VALUES (:message, 1, 1, 1, '[]', 0)"), message=message)
+
+    with baseline.begin() as connection:
+        connection.execute(text("INSERT INTO extension (name, default_state) VALUES ('poll', 1)"))
+        insert(connection, time_snowflake(datetime.utcnow() - timedelta(days=1)))
+    migrations.upgrade(4)
+    with baseline.begin() as connection:
+        insert(connection, time_snowflake(datetime.utcnow() + timedelta(seconds=1)))
+    migrations.upgrade()
+
+    s = db.Session()
+    try:
+        assert [p.legacy for p in s.query(db.Polls).order_by(db.Polls.id)] == [True, None]
+    finally:
+        s.close()
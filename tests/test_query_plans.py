@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import text
+
+from db import migrations
+
+lookups = [
+    ("warns", "SELECT * FROM warns WHERE guild = 1 AND user = 2"),
+    ("warn_actions", "SELECT * FROM warn_actions WHERE guild = 1 AND count = 3"),
+    ("tasks", "SELECT * FROM tasks WHERE date <= '2021-01-01 00:00:00'"),
+    ("tasks", "SELECT * FROM tasks WHERE user = 1"),
+    ("polls", "SELECT * FROM polls WHERE channel = 1"),
+    ("polls", "SELECT * FROM polls WHERE guild = 1"),
+    ("rorec", 'SELECT * FROM rorec WHERE "False" = 1'),
+    ("rorec", "SELECT * FROM rorec WHERE guild = 1"),
+    ("tomuss", "SELECT * FROM tomuss WHERE next_poll <= '2021-01-01 00:00:00' OR next_poll IS NULL"),
+    ("sanctions", "SELECT * FROM sanctions WHERE expires_at > '2021-01-01 00:00:00' ORDER BY expires_at, id"),
+]
+
+
+def plan(connection, query: str) -> list:
+    return [r[-1] for r in connection.execute(text(f"EXPLAIN QUERY PLAN {query}"))]
+
+
+@pytest.mark.parametrize("table, query", lookups)
+def test_lookup_uses_index(baseline, table, query):
+    migrations.upgrade()
+    with baseline.connect() as connection:
+        steps = plan(connection, query)
+    assert steps
+    for step in steps:
+        assert not step.startswith(f"SCAN {table}") and not step.startswith(f"SCAN TABLE {table}"), steps
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from discord import HTTPException
+
+import db
+from conftest import load_extension
+from db import migrations
+
+reminder = load_extension("reminder")
+
+
+def error(cls, status: int):
+    return cls(SimpleNamespace(status=status, reason="test"), "test")
+
+
+class Channel:
+    def __init__(self, channel_id: int, failing: bool = False):
+        self.id = channel_id
+        self.failing = failing
+        self.sent = []
+
+    async def send(self, content=None, embed=None):
+        if self.failing:
+            raise error(HTTPException, 500)
+        self.sent.append((content, embed))
+
+
+class Bot:
+    def __init__(self, channels: dict):
+        self.loop = asyncio.get_event_loop()
+        self.channels = channels
+        self.user = SimpleNamespace(id=1, name="user", discriminator="0001", avatar_url="", mention="<@1>")
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def get_user(self, user_id: int):
+        return self.user
+
+
+def run(channels: list, test):
+    migrations.upgrade()
+
+    async def main():
+        reminder.RETRY_DELAY = 0.05
+        cog = reminder.Reminders(Bot({c.id: c for c in channels}))
+        cog.semaphore = asyncio.Semaphore(1)
+        try:
+            await test(cog)
+        finally:
+            cog.cog_unload()
+            reminder.RETRY_DELAY = 1
+    asyncio.run(main())
+
+
+def add(channel: int) -> int:
+    def add(s) -> int:
+        t = db.Task("test", 1, channel, datetime.now())
+        s.add(t)
+        s.commit()
+        return t.id
+    s = db.Session()
+    try:
+        return add(s)
+    finally:
+        s.close()
+
+
+def remaining() -> list:
+    s = db.Session()
+    try:
+        return [t.id for t in s.query(db.Task).order_by(db.Task.id)]
+    finally:
+        s.close()
+
+
+def test_backoff_does_not_hold_the_semaphore(database):
+    failing, working = Channel(1, failing=True), Channel(2)
+
+    async def test(cog):
+        await asyncio.sleep(0.1)
+        first = add(failing.id)
+        second = add(working.id)
+        cog.channels.update({first: failing.id, second: working.id})
+        cog.reminder_due(first)
+        await asyncio.sleep(0.01)
+        cog.reminder_due(second)
+        await asyncio.sleep(0.2)
+        assert len(working.sent) == 1
+        assert remaining() == [first]
+    run([failing, working], test)
+
+
+def test_requeues_are_capped(database):
+    failing = Channel(1, failing=True)
+
+    async def test(cog):
+        await asyncio.sleep(0.1)
+        reminder.REQUEUES = 1
+        task = add(failing.id)
+        await cog.reminder_deliver(task, asyncio.Lock())
+        assert task in cog.scheduler and cog.requeues == {task: 1}
+        cog.scheduler.remove(task)
+        await cog.reminder_deliver(task, asyncio.Lock())
+        assert task not in cog.scheduler and cog.requeues == {}
+        assert cog.failed == 2
+    try:
+        run([failing], test)
+    finally:
+        reminder.REQUEUES = 10
+    assert remaining() == []
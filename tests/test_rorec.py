@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import db
+from administrator.router import ReactionRouter
+from conftest import load_extension
+from db import migrations
+
+rorec = load_extension("rorec")
+
+
+class Role:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class Guild:
+    id = 1
+
+    def __init__(self):
+        self.roles = {i: Role(i) for i in range(10)}
+
+    def get_role(self, role_id: int):
+        return self.roles.get(role_id)
+
+
+class Member:
+    id = 5
+
+    def __init__(self, guild: Guild):
+        self.guild = guild
+        self.roles = [guild.roles[0]]
+        self.edits = []
+
+    async def edit(self, roles: list, reason: str = None):
+        await asyncio.sleep(0.02)
+        self.edits.append({r.id for r in roles})
+
+
+class Http:
+    async def remove_reaction(self, *args):
+        pass
+
+
+class Bot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self.user = SimpleNamespace(id=0)
+        self.http = Http()
+
+    def add_listener(self, listener):
+        pass
+
+
+def run(test, one: bool = False):
+    migrations.upgrade()
+
+    async def main():
+        bot = Bot()
+        rorec.router = ReactionRouter(bot)
+        cog = rorec.RoRec(bot)
+        m = db.RoRec(1, 1, 1, one)
+        m.data = {"a": [1], "b": [2], "c": [3]}
+        cog.messages[1] = m
+        guild = Guild()
+        member = Member(guild)
+
+        async def click(emoji: str):
+            await cog.reaction_add(SimpleNamespace(message_id=1, channel_id=1, guild_id=1, user_id=member.id,
+                                                   emoji=emoji, member=member))
+        await test(cog, member, click)
+        cog.cog_unload()
+    asyncio.run(main())
+
+
+def test_concurrent_clicks_keep_every_role(database):
+    async def test(cog, member, click):
+        await asyncio.gather(click("a"), click("b"), click("c"))
+        assert member.edits == [{1}, {1, 2}, {1, 2, 3}]
+        assert cog.locks == {} and cog.clicks == {}
+
+        await click("b")
+        assert member.edits[-1] == {1, 3}
+    run(test)
+
+
+def test_one_choice(database):
+    async def test(cog, member, click):
+        await asyncio.gather(click("a"), click("b"))
+        assert member.edits == [{1}, {2}]
+    run(test, one=True)
+
+
+def test_member_update_confirms_applied_roles(database):
+    async def test(cog, member, click):
+        await click("a")
+        assert (1, member.id) in cog.applied
+
+        before = SimpleNamespace(guild=member.guild, id=member.id, roles=list(member.roles))
+        await cog.on_member_update(before, before)
+        assert (1, member.id) in cog.applied
+
+        member.roles = [member.guild.roles[0], member.guild.roles[1]]
+        await cog.on_member_update(before, member)
+        assert cog.applied == {}
+
+        member.roles.append(member.guild.roles[4])
+        await click("b")
+        assert member.edits[-1] == {1, 2, 4}
+    run(test)
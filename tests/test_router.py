@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+from administrator.router import ReactionRouter
+
+
+class Bot:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener.__name__)
+
+
+def make_router():
+    router = ReactionRouter(Bot())
+    calls = []
+
+    def handler(cog: str):
+        async def handle(*args):
+            calls.append((cog, args))
+        return handle
+
+    for cog in ["a", "b"]:
+        for event in ["raw_reaction_add", "raw_reaction_remove", "reaction_add", "reaction_remove"]:
+            router.register(cog, event, handler(cog))
+    return router, calls
+
+
+def payload(message_id: int, channel_id: int = 0):
+    return SimpleNamespace(message_id=message_id, channel_id=channel_id)
+
+
+def reaction(message_id: int, channel_id: int = 0):
+    return SimpleNamespace(message=SimpleNamespace(id=message_id, channel=SimpleNamespace(id=channel_id)))
+
+
+def test_listeners():
+    router = ReactionRouter(Bot())
+    assert sorted(router.bot.listeners) == ["on_raw_reaction_add", "on_raw_reaction_remove",
+                                            "on_reaction_add", "on_reaction_remove"]
+
+
+def test_dispatch_to_message_owner():
+    router, calls = make_router()
+    router.track("a", 1)
+    router.track("b", 2)
+    p = payload(1)
+    asyncio.run(router.on_raw_reaction_add(p))
+    asyncio.run(router.on_raw_reaction_remove(payload(3)))
+    assert calls == [("a", (p,))]
+
+
+def test_dispatch_reaction_with_user():
+    router, calls = make_router()
+    router.track("b", 2)
+    r = reaction(2)
+    asyncio.run(router.on_reaction_remove(r, "user"))
+    assert calls == [("b", (r, "user"))]
+
+
+def test_dispatch_to_channel_owner():
+    router, calls = make_router()
+    router.track_channel("a", 10)
+    router.track("a", 1)
+    asyncio.run(router.on_raw_reaction_add(payload(1, 10)))
+    asyncio.run(router.on_raw_reaction_add(payload(2, 10)))
+    assert [c[0] for c in calls] == ["a", "a"]
+
+    router.untrack_channel(10)
+    asyncio.run(router.on_raw_reaction_add(payload(2, 10)))
+    assert len(calls) == 2
+
+
+def test_dispatch_to_message_and_channel_owners():
+    router, calls = make_router()
+    router.track("a", 1)
+    router.track_channel("b", 10)
+    asyncio.run(router.on_raw_reaction_add(payload(1, 10)))
+    assert sorted(c[0] for c in calls) == ["a", "b"]
+
+
+def test_unregistered_event():
+    router = ReactionRouter(Bot())
+    calls = []
+
+    async def handle(*args):
+        calls.append(args)
+    router.register("a", "raw_reaction_add", handle)
+    router.track("a", 1)
+    asyncio.run(router.on_raw_reaction_remove(payload(1)))
+    assert calls == []
+
+
+def test_untrack():
+    router, calls = make_router()
+    router.track("a", 1)
+    router.track("a", 2)
+    router.untrack(1, 2, 3)
+    asyncio.run(router.on_raw_reaction_add(payload(1)))
+    assert calls == []
+
+
+def test_unregister():
+    router, calls = make_router()
+    router.track("a", 1)
+    router.track("b", 2)
+    router.track_channel("a", 10)
+    router.unregister("a")
+    assert not any(k[0] == "a" for k in router.handlers)
+    assert router.messages == {2: "b"}
+    assert router.channels == {}
+    asyncio.run(router.on_raw_reaction_add(payload(1, 10)))
+    assert calls == []
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from administrator.scheduler import Scheduler
+
+
+def later(seconds: float) -> datetime:
+    return datetime.now() + timedelta(seconds=seconds)
+
+
+def run(test):
+    async def main():
+        fired = []
+        scheduler = Scheduler(fired.append)
+        scheduler.start(asyncio.get_event_loop())
+        try:
+            await test(scheduler, fired)
+        finally:
+            scheduler.stop()
+    asyncio.run(main())
+
+
+def test_fires_in_date_order():
+    async def test(scheduler, fired):
+        scheduler.push("c", later(0.06))
+        scheduler.push("a", later(0.02))
+        scheduler.push("b", later(0.04))
+        assert len(scheduler) == 3
+        await asyncio.sleep(0.2)
+        assert fired == ["a", "b", "c"]
+        assert len(scheduler) == 0
+    run(test)
+
+
+def test_past_date_fires_immediately():
+    async def test(scheduler, fired):
+        scheduler.push("a", later(-60))
+        await asyncio.sleep(0.05)
+        assert fired == ["a"]
+    run(test)
+
+
+def test_earlier_push_wakes_up():
+    async def test(scheduler, fired):
+        scheduler.push("a", later(60))
+        await asyncio.sleep(0.01)
+        scheduler.push("b", later(0.02))
+        await asyncio.sleep(0.1)
+        assert fired == ["b"]
+        assert "a" in scheduler
+    run(test)
+
+
+def test_push_again_reschedules():
+    async def test(scheduler, fired):
+        scheduler.push("a", later(0.02))
+        scheduler.push("a", later(60))
+        await asyncio.sleep(0.1)
+        assert fired == []
+        assert len(scheduler) == 1
+        scheduler.push("a", later(0.02))
+        await asyncio.sleep(0.1)
+        assert fired == ["a"]
+    run(test)
+
+
+def test_remove():
+    async def test(scheduler, fired):
+        scheduler.push("a", later(0.02))
+        scheduler.remove("a")
+        scheduler.remove("unknown")
+        assert "a" not in scheduler
+        await asyncio.sleep(0.1)
+        assert fired == []
+    run(test)
+
+
+def test_stop():
+    async def test(scheduler, fired):
+        scheduler.push("a", later(0.05))
+        scheduler.stop()
+        await asyncio.sleep(0.1)
+        assert fired == []
+        assert scheduler.task.cancelled()
+    run(test)
@@ -0,0 +1,192 @@
+import asyncio
+from itertools import count
+from types import SimpleNamespace
+
+from administrator.router import ReactionRouter
+from conftest import load_extension
+
+speak = load_extension("speak")
+SPEAK, NEXT, CLEAR = "\U0001f5e3", "➡", "❌"
+ids = count(1)
+permissions = SimpleNamespace(mute_members=True, administrator=False)
+
+
+class Message:
+    def __init__(self, channel, content=None, embed=None):
+        self.id = next(ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embed = embed
+        self.edits = 0
+        self.deleted = False
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, user):
+        pass
+
+    async def edit(self, embed=None):
+        self.embed = embed
+        self.edits += 1
+
+    async def delete(self):
+        self.deleted = True
+
+
+class TextChannel:
+    def __init__(self, guild):
+        self.id = next(ids)
+        self.guild = guild
+        self.messages = []
+
+    def permissions_for(self, member):
+        return permissions
+
+    async def send(self, content=None, embed=None):
+        message = Message(self, content, embed)
+        self.messages.append(message)
+        return message
+
+
+class VoiceChannel:
+    def __init__(self):
+        self.id = next(ids)
+        self.members = []
+
+    def permissions_for(self, member):
+        return permissions
+
+
+class Member:
+    def __init__(self, guild, voice: VoiceChannel):
+        self.id = next(ids)
+        self.guild = guild
+        self.bot = False
+        self.mention = f"<@{self.id}>"
+        self.display_name = f"member {self.id}"
+        self.voice = SimpleNamespace(channel=voice, mute=False)
+        self.edits = 0
+
+    async def edit(self, mute: bool):
+        self.voice.mute = mute
+        self.edits += 1
+
+
+class Guild:
+    def __init__(self, members: int):
+        self.id = next(ids)
+        self.voice = VoiceChannel()
+        self.text = TextChannel(self)
+        self.members = {}
+        for _ in range(members):
+            m = Member(self, self.voice)
+            self.members[m.id] = m
+            self.voice.members.append(m)
+
+    def get_member(self, member_id: int):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id: int):
+        return self.voice if channel_id == self.voice.id else None
+
+
+class Reaction:
+    def __init__(self, message: Message, emoji: str):
+        self.message = message
+        self.emoji = emoji
+
+    async def remove(self, user):
+        pass
+
+
+class Bot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+
+    def add_listener(self, listener):
+        pass
+
+
+def make_cog():
+    speak.router = ReactionRouter(Bot())
+    speak.RENDER_DELAY = 0.01
+    return speak.Speak(Bot())
+
+
+async def setup_session(cog, guild: Guild, strict: bool = False) -> Message:
+    author = next(iter(guild.members.values()))
+
+    async def send(content=None):
+        pass
+    await speak.Speak.speak_setup.func(cog, SimpleNamespace(guild=guild, author=author, channel=guild.text, send=send),
+                                       strict)
+    return cog.sessions[guild.id].voice_message
+
+
+async def react(guild: Guild, message: Message, emoji: str, member: Member):
+    await speak.router.on_reaction_add(Reaction(message, emoji), member)
+
+
+def test_sessions_are_per_guild():
+    async def test():
+        cog = make_cog()
+        first, second = Guild(3), Guild(3)
+        m1, m2 = await setup_session(cog, first), await setup_session(cog, second)
+        assert set(cog.sessions) == {first.id, second.id}
+
+        for member in first.members.values():
+            await react(first, m1, SPEAK, member)
+        assert cog.sessions[first.id].waiting == list(first.members)
+        assert cog.sessions[second.id].waiting == []
+
+        await react(second, m1, SPEAK, next(iter(second.members.values())))
+        assert cog.sessions[second.id].waiting == []
+
+        await react(first, m1, NEXT, next(iter(first.members.values())))
+        assert first.text.messages[-1].content == f"It's <@{list(first.members)[0]}> turn"
+        assert second.text.messages == [m2]
+        cog.cog_unload()
+    asyncio.run(test())
+
+
+def test_list_render_is_coalesced():
+    async def test():
+        cog = make_cog()
+        guild = Guild(10)
+        message = await setup_session(cog, guild)
+        for member in guild.members.values():
+            await react(guild, message, SPEAK, member)
+        await asyncio.sleep(0.05)
+        assert message.edits == 1
+        assert message.embed.fields[0].value.count("\n") == 9
+        cog.cog_unload()
+    asyncio.run(test())
+
+
+def test_clear_only_ends_its_session():
+    async def test():
+        cog = make_cog()
+        first, second = Guild(2), Guild(2)
+        m1, m2 = await setup_session(cog, first), await setup_session(cog, second)
+        await react(first, m1, CLEAR, next(iter(first.members.values())))
+        assert list(cog.sessions) == [second.id]
+        assert m1.deleted and not m2.deleted
+        assert m1.id not in speak.router.messages and m2.id in speak.router.messages
+        cog.cog_unload()
+    asyncio.run(test())
+
+
+def test_strict_join_is_muted_in_its_guild_only():
+    async def test():
+        cog = make_cog()
+        first, second = Guild(1), Guild(1)
+        await setup_session(cog, first, strict=True)
+        await setup_session(cog, second)
+        for guild in (first, second):
+            member = Member(guild, guild.voice)
+            await cog.on_voice_state_update(member, SimpleNamespace(channel=None), member.voice)
+            assert member.voice.mute == (guild is first)
+        cog.cog_unload()
+    asyncio.run(test())
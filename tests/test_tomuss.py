@@ -0,0 +1,190 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web, ClientResponseError
+from aiohttp.test_utils import TestServer
+
+import db
+from conftest import load_extension
+from db import migrations
+
+tomuss = load_extension("tomuss")
+
+RSS = """<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Tomuss</title>{}</channel></rss>"""
+ITEM = "<item><title>{0}</title><description>Note {0}</description><pubDate>{1}</pubDate></item>"
+
+
+class Feed:
+    def __init__(self):
+        self.version = 1
+        self.status = 200
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(request.headers))
+        if self.status != 200:
+            return web.Response(status=self.status)
+        etag = f'"v{self.version}"'
+        modified = f"Mon, 0{self.version} Feb 2021 10:00:00 GMT"
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        items = "".join(ITEM.format(f"UE{i}", f"Mon, 0{i} Feb 2021 10:00:00 GMT")
+                        for i in range(1, self.version + 1))
+        return web.Response(body=RSS.format(items), content_type="application/rss+xml",
+                            headers={"ETag": etag, "Last-Modified": modified})
+
+
+class User:
+    def __init__(self):
+        self.embeds = []
+
+    async def send(self, content=None, embed=None):
+        self.embeds.append(embed)
+
+
+def run(test):
+    async def main():
+        feed = Feed()
+        app = web.Application()
+        app.router.add_get("/feed", feed.handle)
+        server = TestServer(app)
+        await server.start_server()
+
+        user = User()
+        bot = SimpleNamespace(loop=asyncio.get_event_loop(), get_user=lambda i: user)
+        cog = tomuss.Tomuss.__new__(tomuss.Tomuss)
+        cog.bot = bot
+        cog.session = None
+        cog.semaphore = asyncio.Semaphore(2)
+        try:
+            await test(cog, feed, str(server.make_url("/feed")), user)
+        finally:
+            if cog.session:
+                await cog.session.close()
+            await server.close()
+    asyncio.run(main())
+
+
+def test_conditional_get():
+    async def test(cog, feed, url, user):
+        t = db.Tomuss(1, url, None)
+        entries, validators = await cog.fetch(t)
+        assert [e.title for e in entries] == ["UE1"]
+        assert validators == ('"v1"', "Mon, 01 Feb 2021 10:00:00 GMT")
+        assert t.etag is None
+        assert "If-None-Match" not in feed.requests[0]
+
+        t.etag, t.modified = validators
+        assert await cog.fetch(t) == (None, None)
+        assert feed.requests[1]["If-None-Match"] == '"v1"'
+        assert feed.requests[1]["If-Modified-Since"] == "Mon, 01 Feb 2021 10:00:00 GMT"
+
+        feed.version = 2
+        entries, validators = await cog.fetch(t)
+        assert [e.title for e in entries] == ["UE1", "UE2"]
+        assert validators[0] == '"v2"'
+
+        feed.status = 500
+        with pytest.raises(ClientResponseError):
+            await cog.fetch(t)
+    run(test)
+
+
+def test_check(database):
+    migrations.upgrade()
+
+    async def test(cog, feed, url, user):
+        t = db.Tomuss(1, url, datetime(2021, 2, 1, 10))
+        t.poll_interval = tomuss.DEFAULT_INTERVAL
+        t.failures = 0
+        t.next_poll = datetime.now()
+
+        def add(s):
+            s.add(t)
+            s.commit()
+        await db.run(add)
+
+        def load(s) -> db.Tomuss:
+            return s.query(db.Tomuss).get(1)
+
+        await cog.tomuss_check(t)
+        assert user.embeds == []
+        saved = await db.run(load)
+        assert saved.etag == '"v1"'
+        assert saved.poll_interval > tomuss.DEFAULT_INTERVAL
+        assert saved.next_poll > datetime.now()
+
+        await cog.tomuss_check(t)
+        assert len(feed.requests) == 2
+        assert user.embeds == []
+
+        feed.version = 2
+        await cog.tomuss_check(t)
+        assert [f.name for f in user.embeds[0].fields] == ["UE2"]
+        saved = await db.run(load)
+        assert saved.last == datetime(2021, 2, 2, 10)
+        assert saved.failures == 0
+
+        feed.status = 503
+        await cog.tomuss_check(t)
+        saved = await db.run(load)
+        assert saved.failures == 1
+        assert saved.next_poll > datetime.now() + timedelta(seconds=tomuss.DEFAULT_INTERVAL)
+    run(test)
+
+
+def test_check_unexpected_error(database):
+    migrations.upgrade()
+
+    async def test(cog, feed, url, user):
+        t = db.Tomuss(1, url, datetime(2021, 1, 1))
+        t.next_poll = datetime.now()
+
+        def add(s):
+            s.add(t)
+            s.commit()
+        await db.run(add)
+
+        def load(s) -> db.Tomuss:
+            return s.query(db.Tomuss).get(1)
+
+        async def send(content=None, embed=None):
+            raise RuntimeError()
+        deliver = user.send
+        user.send = send
+        await cog.tomuss_check(t)
+        saved = await db.run(load)
+        assert saved.failures == 1
+        assert saved.next_poll > datetime.now()
+        assert saved.etag is None and saved.last == datetime(2021, 1, 1)
+
+        user.send = deliver
+        await cog.tomuss_check(saved)
+        assert "If-None-Match" not in feed.requests[-1]
+        assert [f.name for f in user.embeds[0].fields] == ["UE1"]
+        saved = await db.run(load)
+        assert saved.etag == '"v1"' and saved.failures == 0
+    run(test)
+
+
+def test_check_unset_during_fetch(database):
+    migrations.upgrade()
+
+    async def test(cog, feed, url, user):
+        t = db.Tomuss(1, url, datetime(2021, 1, 1))
+
+        def add(s):
+            s.add(t)
+            s.commit()
+        await db.run(add)
+
+        def unset(s):
+            s.query(db.Tomuss).filter(db.Tomuss.user_id == 1).delete()
+            s.commit()
+        await db.run(unset)
+        await cog.tomuss_check(t)
+        assert await db.run(lambda s: s.query(db.Tomuss).count()) == 0
+    run(test)
@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from discord import HTTPException, Forbidden, NotFound
+from sqlalchemy import event
+
+import db
+from administrator.router import ReactionRouter
+from conftest import load_extension
+from db import migrations
+
+warn = load_extension("warn")
+
+
+def error(cls, status: int):
+    return cls(SimpleNamespace(status=status, reason="test"), "test")
+
+
+class Guild:
+    id = 1
+    roles = []
+
+    def __init__(self, errors: dict):
+        self.errors = errors
+        self.unbans = []
+
+    async def unban(self, user, reason=None):
+        e = self.errors.get(user.id)
+        if callable(e):
+            e = e()
+        if e:
+            raise e
+        self.unbans.append(user.id)
+
+
+class Bot:
+    def __init__(self, guild: Guild):
+        self.loop = asyncio.get_event_loop()
+        self.guild = guild
+
+    def add_listener(self, listener):
+        pass
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_guild(self, guild_id: int):
+        return self.guild
+
+
+def run(errors: dict, users: list, test, batch: int = 2):
+    migrations.upgrade()
+    now = datetime.now()
+
+    def add(s):
+        for i, user in enumerate(users):
+            s.add(db.Sanction(1, user, "ban", now + timedelta(seconds=0.05 + i*0.01)))
+        s.commit()
+    s = db.Session()
+    try:
+        add(s)
+    finally:
+        s.close()
+
+    async def main():
+        guild = Guild(errors)
+        warn.router = ReactionRouter(Bot(guild))
+        warn.SANCTION_BATCH = batch
+        warn.SANCTION_RETRY = 0.05
+        cog = warn.Warn(Bot(guild))
+        try:
+            await test(cog, guild)
+        finally:
+            cog.cog_unload()
+    asyncio.run(main())
+
+
+def remaining() -> list:
+    s = db.Session()
+    try:
+        return [x.user for x in s.query(db.Sanction).order_by(db.Sanction.user)]
+    finally:
+        s.close()
+
+
+def test_sanctions_expire_in_batches(database):
+    async def test(cog, guild):
+        await asyncio.sleep(0.5)
+        assert sorted(guild.unbans) == list(range(100, 107))
+        assert cog.exhausted
+    run({}, list(range(100, 107)), test)
+    assert remaining() == []
+
+
+def test_forbidden_does_not_block_next_batches(database):
+    async def test(cog, guild):
+        await asyncio.sleep(0.5)
+        assert guild.unbans == [102, 103]
+        assert len(cog.scheduler) == 0
+    run({100: error(Forbidden, 403), 101: error(NotFound, 404)}, [100, 101, 102, 103], test)
+    assert remaining() == []
+
+
+def test_transient_failure_is_retried_without_blocking(database):
+    failures = []
+
+    def flaky():
+        if len(failures) < 2:
+            failures.append(1)
+            return error(HTTPException, 503)
+
+    async def test(cog, guild):
+        await asyncio.sleep(0.6)
+        assert sorted(guild.unbans) == [100, 101, 102, 103]
+        assert guild.unbans.index(100) > guild.unbans.index(102)
+    run({100: flaky}, [100, 101, 102, 103], test)
+    assert remaining() == []
+
+
+def test_retries_are_capped(database):
+    async def test(cog, guild):
+        warn.SANCTION_RETRIES = 2
+        await asyncio.sleep(1)
+        assert guild.unbans == [101, 102, 103]
+        assert cog.retries == {}
+    try:
+        run({100: error(HTTPException, 500)}, [100, 101, 102, 103], test)
+    finally:
+        warn.SANCTION_RETRIES = 5
+    assert remaining() == []
+
+
+def test_count_warn(database):
+    migrations.upgrade()
+    s = db.Session()
+    try:
+        assert warn.Warn.count_warn(s, 1, 100, 1) == 1
+        assert warn.Warn.count_warn(s, 1, 100, 1) == 2
+        assert warn.Warn.count_warn(s, 1, 100, -1) == 1
+        assert warn.Warn.count_warn(s, 2, 100, 1) == 1
+        assert warn.Warn.count_warn(s, 1, 101, -1) == 0
+    finally:
+        s.close()
+
+
+def test_count_warn_concurrent_first_warn(database):
+    migrations.upgrade()
+    s = db.Session()
+
+    def concurrent_insert(update_context):
+        if update_context.rowcount == 0:
+            s.connection().execute(db.WarnCount.__table__.insert().values(guild=1, user=100, count=1))
+    event.listen(s, "after_bulk_update", concurrent_insert)
+    try:
+        assert warn.Warn.count_warn(s, 1, 100, 1) == 2
+    finally:
+        s.close()
+
+
+def test_warn_pages(database):
+    migrations.upgrade()
+    s = db.Session()
+    try:
+        for i in range(25):
+            s.add(db.Warn(100 + i % 3, 1, 1, f"warn {i}"))
+        s.add(db.Warn(100, 1, 2, "other guild"))
+        s.commit()
+    finally:
+        s.close()
+
+    async def test():
+        cog = warn.Warn.__new__(warn.Warn)
+        cog.bot = SimpleNamespace(get_user=lambda i: None)
+        pages, key = [], None
+        while True:
+            embed, key = await cog.warn_page(1, None, key)
+            pages.append([f.value.split("```")[1] for f in embed.fields])
+            if not key:
+                break
+        assert [len(p) for p in pages] == [10, 10, 5]
+        descriptions = [d for p in pages for d in p]
+        assert descriptions == [f"warn {i}" for u in range(3) for i in range(u, 25, 3)]
+
+        embed, key = await cog.warn_page(1, 101, None)
+        assert len(embed.fields) == 8 and key is None
+        embed, key = await cog.warn_page(1, 200, None)
+        assert embed.description == "No warn" and key is None
+    asyncio.run(test())